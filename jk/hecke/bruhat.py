@@ -0,0 +1,197 @@
+import numpy as np
+
+"""
+The Bruhat order on a generated CoxeterGroup. The order ideals
+{x : x <= w} are stored as packed bitsets, one row per element, and are
+built by induction over length: if ws < w then
+    {x : x <= w} = {x : x <= ws} union {xs : x <= ws}.
+"""
+
+# Number of rows unpacked at once while building the bitsets
+CHUNK_SIZE = 1024
+
+
+class BruhatOrder:
+    def __init__(self, group, below=None):
+        """
+        :param group: The CoxeterGroup.
+        :param below: The packed order ideals of a previous BruhatOrder of
+            the group, if available, else they are generated.
+        """
+        self.group = group
+        self.n = len(group.names)
+        self.below = below
+        self._times_longest = None
+        self._rank_matrices = None
+        self._type_d_conditions = None
+        self.criterion = _criterion_type(group)
+        if below is None:
+            self._generate()
+
+    def _generate(self):
+        """Fills in self.below, where bit x of row w is set if x <= w."""
+        group = self.group
+        n = self.n
+        below = np.zeros((n, (n + 7) // 8), dtype=np.uint8)
+        below[0] = np.packbits(np.arange(n) == 0)
+        lengths = group.lengths
+        for length in range(1, int(lengths.max()) + 1):
+            layer = np.flatnonzero(lengths == length)
+            # Every element w = ws * s with s = last_generator[w] a right
+            # descent, and ws = prefix[w] one shorter.
+            for s in range(len(group.generator_names)):
+                rows = layer[group.last_generator[layer] == s]
+                for start in range(0, len(rows), CHUNK_SIZE):
+                    chunk = rows[start:start + CHUNK_SIZE]
+                    parents = np.unpackbits(below[group.prefix[chunk]],
+                                            axis=1)[:, :n].astype(bool)
+                    # z is in {xs : x <= ws} if zs <= ws
+                    ideal = parents | parents[:, group.right_mul[:, s]]
+                    below[chunk] = np.packbits(ideal, axis=1)
+        self.below = below
+
+    def le(self, x, y):
+        """Returns True if x <= y, given element indices x and y"""
+        return bool((self.below[y, x >> 3] >> (7 - (x & 7))) & 1)
+
+    def lower(self, w):
+        """Returns the indices of {x : x <= w}, in index order"""
+        return np.flatnonzero(self._row(self.below[w]))
+
+    def upper(self, y):
+        """Returns the indices of {x : x >= y}, in index order"""
+        return np.flatnonzero(self._upper_row(y))
+
+    def interval(self, y, w):
+        """Iterates over the indices of the interval [y, w], in index
+        order"""
+        if not self.le(y, w):
+            return
+        for x in np.flatnonzero(self._row(self.below[w]) & self._upper_row(y)):
+            yield int(x)
+
+    def times_longest(self):
+        """Returns the array of indices of x * w0"""
+        if self._times_longest is None:
+            ret = np.arange(self.n)
+            for s in self.group.word(self.n - 1):
+                ret = self.group.right_mul[ret, s]
+            self._times_longest = ret
+        return self._times_longest
+
+    def _row(self, packed):
+        return np.unpackbits(packed)[:self.n].astype(bool)
+
+    def _upper_row(self, y):
+        # x >= y if and only if x * w0 <= y * w0
+        w0 = self.times_longest()
+        return self._row(self.below[w0[y]])[w0]
+
+    def tableau_le(self, x, y):
+        """
+        Compares x and y using the rank matrix criterion for (signed)
+        permutations, without using the bitsets. Only available for the
+        groups of type A, B and D generated in coxeter.py.
+
+        Type D uses the criterion of Bjorner-Brenti, Theorem 8.2.8: x <= y
+        if x[i, j] <= y[i, j] for all i, j in [-n, n], and whenever
+        [-i, i] x [-j, j] is empty for both x and y (i, j in [n - 1]) and
+        x[-i-1, j+1] = y[-i-1, j+1], then x[-1, j+1] = y[-1, j+1] mod 2.
+        """
+        if self.criterion is None:
+            raise Exception('No tableau criterion for this group')
+        ranks = self.rank_matrices()
+        if not (ranks[x] <= ranks[y]).all():
+            return False
+        if self.criterion == 'D':
+            empty, outer, parity = self._type_d()
+            checked = empty[x] & empty[y] & (outer[x] == outer[y])
+            return not (checked & (parity[x] != parity[y])).any()
+        return True
+
+    def rank_matrices(self):
+        """
+        Returns the array of rank matrices r[w, i, j] = #{a <= i : w(a) >= j}.
+        Elements of type B and D are embedded into the permutations of
+        {-n, ..., -1, 1, ..., n}; for type B the order is the induced one.
+        """
+        if self._rank_matrices is None:
+            values = self.group.permutation_array.astype(np.int64)
+            if self.criterion in ('B', 'D'):
+                values = _standard_type_b(values)
+                m = values.shape[1]
+                # Positions -m..-1, 1..m map to 0..2m-1
+                values = np.concatenate([-values[:, ::-1], values], axis=1)
+                values = np.where(values < 0, values + m, values + m - 1)
+            else:
+                values = values - 1
+            n, m = values.shape
+            one_hot = np.zeros((n, m, m), dtype=np.int16)
+            one_hot[np.arange(n).reshape(-1, 1), np.arange(m), values] = 1
+            above = np.cumsum(one_hot[:, :, ::-1], axis=2)[:, :, ::-1]
+            self._rank_matrices = np.cumsum(above, axis=1)
+        return self._rank_matrices
+
+    def _type_d(self):
+        """
+        Returns the arrays (empty, outer, parity) of the extra condition of
+        type D, indexed by [w, i - 1, j - 1] for i, j in [n - 1]: whether
+        [-i, i] x [-j, j] is empty for w, the rank w[-i-1, j+1], and the
+        parity of w[-1, j+1] (indexed by [w, 0, j - 1]).
+        """
+        if self._type_d_conditions is None:
+            ranks = self.rank_matrices()
+            m = ranks.shape[1] // 2
+            # Position (or value) -k has index m - k, and k has index m + k - 1
+            k = np.arange(1, m)
+            low, high = m - k - 1, m + k - 1
+            rows_low, rows_high = low.reshape(-1, 1), high.reshape(-1, 1)
+            columns_low, columns_high = (m - k).reshape(1, -1), (m + k).reshape(1, -1)
+            # The number of a in [-i, i] with w(a) in [-j, j]
+            count = (ranks[:, rows_high, columns_low] - ranks[:, rows_low, columns_low]
+                     - ranks[:, rows_high, columns_high]
+                     + ranks[:, rows_low, columns_high])
+            outer = ranks[:, rows_low, columns_high]
+            parity = ranks[:, m - 1, m + k].reshape(-1, 1, m - 1) % 2
+            self._type_d_conditions = (count == 0, outer, parity)
+        return self._type_d_conditions
+
+
+def _criterion_type(group):
+    """Returns 'A', 'B' or 'D' if the generators are the standard ones of
+    that type (as in coxeter.py), else None."""
+    generators = [group.generators[name].values for name in group.generator_names]
+    m = len(generators[0]) if generators else 0
+    transpositions = set()
+    sign_changes = 0
+    double_sign_changes = 0
+    for values in generators:
+        if values == list(range(1, m)) + [-m]:
+            sign_changes += 1
+            continue
+        if m >= 2 and values == list(range(1, m - 1)) + [-m, 1 - m]:
+            double_sign_changes += 1
+            continue
+        swapped = [i for i, v in enumerate(values) if v != i + 1]
+        if (len(swapped) != 2 or swapped[1] != swapped[0] + 1
+                or values[swapped[0]] != swapped[1] + 1
+                or values[swapped[1]] != swapped[0] + 1):
+            return None
+        transpositions.add(swapped[0])
+    if transpositions != set(range(m - 1)):
+        return None
+    if sign_changes == 0 and double_sign_changes == 0:
+        return 'A'
+    elif sign_changes == 1 and double_sign_changes == 0:
+        return 'B'
+    elif sign_changes == 0 and double_sign_changes == 1:
+        return 'D'
+    return None
+
+
+def _standard_type_b(values):
+    """Conjugates signed permutations by i -> m + 1 - i, which turns the
+    sign changes of the last coordinates into those of the first."""
+    m = values.shape[1]
+    reversed_values = values[:, ::-1]
+    return np.sign(reversed_values) * (m + 1 - np.abs(reversed_values))
@@ -0,0 +1,104 @@
+import hashlib
+import jk.hecke.coxeter as cox
+import jk.hecke.hecke as h
+import json
+import os
+import shutil
+import tempfile
+
+"""
+A persistent cache of generated groups and Hecke algebra data. Each entry
+is a directory root/<key>, where the key is a hash of the generators, with
+the .npy files written by CoxeterGroup.save or HeckeAlgebra.save and a file
+format.json recording the format version, the key and what was saved.
+Entries are written to a temporary directory and renamed into place, so
+other processes never see a partial entry, and loaded memory mapped, so
+processes loading the same entry share its pages.
+"""
+
+# Entries with a different version are regenerated
+FORMAT_VERSION = 1
+
+
+def key(generators):
+    """Returns the hex digest identifying the group generated by the map
+    'generators' from name to Permutation"""
+    data = json.dumps(sorted((name, [int(value) for value in permutation.values])
+                             for name, permutation in generators.items()))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def cached_group(generators, root):
+    """
+    Returns the CoxeterGroup generated by 'generators', loaded from the cache
+    directory 'root', or generated and added to the cache.
+    """
+    directory = _entry(generators, root, 'group')
+    if directory is not None:
+        return cox.CoxeterGroup.load(directory)
+    group = cox.CoxeterGroup.generate(generators)
+    group.bruhat_order()
+    _store(generators, root, 'group', group.save)
+    return group
+
+
+def cached_hecke(generators, root, **kwargs):
+    """
+    Returns the HeckeAlgebra of the group generated by 'generators', loaded
+    from the cache directory 'root'. If it is not cached, the KL basis, dual
+    KL basis and orders of the cached group are computed and added to the
+    cache.
+    :param kwargs: The further arguments of the HeckeAlgebra.
+    """
+    directory = _entry(generators, root, 'hecke')
+    if directory is not None:
+        return h.HeckeAlgebra.load(directory, **kwargs)
+    hecke = h.HeckeAlgebra(cached_group(generators, root), **kwargs)
+    hecke.generate_kl_basis()
+    hecke.generate_dual_kl_basis()
+    hecke.generate_orders()
+    _store(generators, root, 'hecke', hecke.save)
+    return hecke
+
+
+def _entry(generators, root, content):
+    """Returns the directory of the cache entry of the generators if it is
+    valid and contains 'content', else None"""
+    directory = os.path.join(root, key(generators))
+    try:
+        with open(os.path.join(directory, 'format.json')) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (info.get('version') != FORMAT_VERSION or
+            info.get('key') != key(generators) or
+            content not in info.get('contents', [])):
+        return None
+    return directory
+
+
+def _store(generators, root, content, save):
+    """Writes a cache entry with save(directory), replacing an outdated or
+    incomplete entry of the generators. A valid entry written by another
+    process in the meantime is kept."""
+    os.makedirs(root, exist_ok=True)
+    directory = os.path.join(root, key(generators))
+    contents = ['group', 'hecke'] if content == 'hecke' else ['group']
+    temporary = tempfile.mkdtemp(dir=root)
+    try:
+        save(temporary)
+        with open(os.path.join(temporary, 'format.json'), 'w') as f:
+            json.dump({'version': FORMAT_VERSION, 'key': key(generators),
+                       'contents': contents}, f)
+        if _entry(generators, root, content) is not None:
+            return
+        if os.path.exists(directory):
+            # Processes still using the old files keep their mappings
+            shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.rename(temporary, directory)
+        except OSError:
+            # Another process has written the entry in the meantime
+            pass
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
@@ -0,0 +1,68 @@
+import jk.hecke.graph as gr
+import numpy as np
+
+"""
+Kazhdan-Lusztig cells, the strongly connected components of the digraphs
+x -> y where C_y occurs in C_x C_s (right cells), C_s C_x (left cells) or
+either (two-sided cells).
+"""
+
+
+class Cells:
+    """
+    A partition of the group into cells. labels[x] is the number of the cell
+    of the element with index x, and dag[c] the set of cells directly below
+    cell c. Cells are numbered so that the cells below c have smaller
+    numbers; in particular the cell of the identity, which is the largest,
+    has the largest number.
+    """
+    def __init__(self, group, labels, dag):
+        self.group = group
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.dag = dag
+        self.count = len(dag)
+        self._labels = self.labels.tolist()
+        self._members = None
+        self._reach = None
+
+    @staticmethod
+    def from_digraph(group, successors):
+        """Returns the Cells of the digraph given by the successors of each
+        element index"""
+        labels, components = gr.strongly_connected_components(successors)
+        return Cells(group, labels,
+                     gr.condensation(successors, labels, len(components)))
+
+    def __len__(self):
+        return self.count
+
+    def label(self, x):
+        """The number of the cell of x, given by name or index"""
+        return self._labels[self.group.index(x)]
+
+    def same_cell(self, x, y):
+        return self.label(x) == self.label(y)
+
+    def members(self, c):
+        """The element indices in cell c, in index order"""
+        if self._members is None:
+            self._members = [[] for _ in range(self.count)]
+            for x, label in enumerate(self._labels):
+                self._members[label].append(x)
+        return self._members[c]
+
+    def cell(self, x):
+        """The element indices in the cell of x"""
+        return self.members(self.label(x))
+
+    def cells(self):
+        """The list of all cells, as lists of element indices"""
+        return [self.members(c) for c in range(self.count)]
+
+    def le(self, x, y):
+        """Returns True if the cell of x is below (or equal to) the cell of y"""
+        if self._reach is None:
+            self._reach = gr.reachability(self.dag)
+        labels, _, reach = self._reach
+        c = self.label(x)
+        return bool((reach[labels[self.label(y)]] >> c) & 1)
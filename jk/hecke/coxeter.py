@@ -1,6 +1,16 @@
-from jk.hecke import permutation as p
+from jk.hecke import bruhat as b, permutation as p
+import numpy as np
+import os
 import sortedcontainers as sc
 
+# Groups with at most this many elements get a full n x n product table the
+# first time two arbitrary elements are multiplied.
+FULL_TABLE_LIMIT = 2048
+
+# The integer tables of a group written by CoxeterGroup.save
+_SAVED_ARRAYS = ['permutation_array', 'lengths', 'prefix', 'last_generator',
+                 'right_mul', 'inverse_index']
+
 """
 Perhaps not the ideal set-up. We have two linked classes, where the element
 only knows its name and which group it belongs to. The group knows which
@@ -16,11 +26,7 @@ class CoxeterElement:
     def __mul__(self, other):
         if self.group != other.group:
             raise Exception("Can't multiply elements from different groups")
-        # Calculate the new permutation
-        new_permutation = self.group.permutations[self.name] * other.group.permutations[other.name]
-        # Find the name of this element
-        new_name = self.group.name_lookup[new_permutation]
-        return self.group[new_name]
+        return self.group[self.group.multiply(self.index, other.index)]
 
     def inverse(self):
         return self.group.get_inverse(self.name)
@@ -29,10 +35,7 @@ class CoxeterElement:
         return self.group.permutations[self.name]
 
     def length(self):
-        if self.name == 'e':
-            return 0
-        else:
-            return len(self.name)
+        return int(self.group.lengths[self.index])
 
     def __str__(self):
         return self.name
@@ -50,18 +53,95 @@ class CoxeterGroup:
         self.permutations = permutations
         self.name_lookup = name_lookup
         self.inverse = inverse
-
-    def __getitem__(self, name):
-        if name in self.elements:
-            return self.elements[name]
+        # Integer tables filled in by generate(). Generators are numbered by
+        # their position in sorted(generators), elements by their index.
+        self.names = []
+        self.generator_names = sorted(generators.keys())
+        self.right_mul = None
+        self.left_mul = None
+        self.prefix = None
+        self.last_generator = None
+        self.inverse_index = None
+        self.permutation_array = None
+        self.lengths = None
+        # Bit s is set if s is a right (left) descent of the element
+        self.right_descents = None
+        self.left_descents = None
+        self._product_table = None
+        self._bruhat_order = None
+
+    def __getitem__(self, key):
+        """Looks up an element by name, reduced word or index."""
+        if not isinstance(key, str):
+            return self.elements[self.names[key]]
+        elif key in self.elements:
+            return self.elements[key]
+        else:
+            return self.get_x(key)
+
+    def index(self, key):
+        """Returns the index of the element given by name, word in the
+        generators or index. Raises KeyError for unknown names."""
+        if not isinstance(key, str):
+            return int(key)
+        elif key in self.elements:
+            return self.elements[key].index
         else:
-            return self.get_x(name)
+            return self.get_x(key).index
 
     def get_x(self, name):
-        element = self['e']
-        for generator_name in list(name):
-            element *= self.elements[generator_name]
-        return element
+        """Returns the product of the generators in the word 'name'"""
+        index = 0
+        for generator_name in name:
+            if generator_name not in self.generators:
+                raise KeyError(f'Unknown element {name}')
+            index = self.right_mul[index, self.generator_names.index(generator_name)]
+        return self[int(index)]
+
+    def is_right_descent(self, w, s):
+        """Returns True if l(ws) < l(w), where w is an element index and s
+        the position of a generator in generator_names."""
+        return bool((self.right_descents[w] >> s) & 1)
+
+    def is_left_descent(self, w, s):
+        """Returns True if l(sw) < l(w), where w is an element index and s
+        the position of a generator in generator_names."""
+        return bool((self.left_descents[w] >> s) & 1)
+
+    def word(self, w):
+        """Returns the reduced word (as in the name) of the element with
+        index w, as a list of generator positions."""
+        word = []
+        while w != 0:
+            word.append(int(self.last_generator[w]))
+            w = self.prefix[w]
+        return word[::-1]
+
+    def multiply(self, x, y):
+        """Returns the index of the product of the elements with indices x
+        and y."""
+        if self._product_table is None and len(self.names) <= FULL_TABLE_LIMIT:
+            self.product_table()
+        if self._product_table is not None:
+            return int(self._product_table[x, y])
+        for s in self.word(y):
+            x = self.right_mul[x, s]
+        return int(x)
+
+    def product_table(self):
+        """Returns the n x n table of element indices with
+        table[x, y] = index of x * y."""
+        if self._product_table is None:
+            n = len(self.names)
+            table = np.empty((n, n), dtype=np.int32)
+            table[:, 0] = np.arange(n)
+            # The prefix of y has a smaller index than y, so its column is
+            # already filled in.
+            for y in range(1, n):
+                table[:, y] = self.right_mul[table[:, self.prefix[y]],
+                                             self.last_generator[y]]
+            self._product_table = table
+        return self._product_table
 
     def get_inverse(self, name):
         return self.inverse[name]
@@ -88,54 +168,113 @@ class CoxeterGroup:
         lengths = set([len(v) for v in generators.values()])
         if len(lengths) != 1:
             raise Exception(f'Generators should all have the same length (lengths: {lengths})')
+        for name, generator in generators.items():
+            values = list(generator.values)
+            if sorted(abs(v) for v in values) != list(range(1, len(values) + 1)):
+                raise Exception(f'Generator {name} is not a signed permutation: {values}')
+            if (generator * generator).values != list(range(1, len(values) + 1)):
+                raise Exception(f'Generator {name} is not an involution: {values}')
+
+        (values, lengths, prefix, last_generator,
+         right_mul, inverse_index) = _generate_arrays(
+            [g.values for g in sorted_generators.values()])
+        group._set_arrays(values, lengths, prefix, last_generator, right_mul,
+                          inverse_index)
+        return group
 
-        seen_permutations = set()
-        # Add identity
-        identity_permutation = p.Permutation(list(range(1, list(lengths)[0] + 1)))
-        elements['e'] = CoxeterElement(group, 'e', 0)
-        group.identity = elements['e']
-        permutations['e'] = identity_permutation
-        seen_permutations.add(identity_permutation)
-        # Add generators
-        for name, permutation in sorted_generators.items():
-            elements[name] = CoxeterElement(group, name, len(elements))
-            seen_permutations.add(permutation)
-            permutations[name] = permutation
-        # Generate the rest of the elements
-        last_layer = generators
-        nrloops = 0
-        while len(last_layer) > 0:
-            new_permutations = dict()
-            for name, permutation in last_layer.items():
-                for gname, generator in sorted_generators.items():
-                    new_name = name + gname
-                    new_permutation = permutation * generator
-                    if not new_permutation in seen_permutations:
-                        permutations[new_name] = new_permutation
-                        seen_permutations.add(new_permutation)
-                        elements[new_name] = CoxeterElement(group, new_name, len(elements))
-                        new_permutations[new_name] = new_permutation
-            last_layer = new_permutations
-            nrloops += 1
-
-        for name, permutation in permutations.items():
-            name_lookup[permutation] = name
-
-        # Calculate inverses
-        for name, permutation in permutations.items():
-            inverse = identity_permutation
-            inverse_name = name[::-1] # Reversed string
-            for generator in inverse_name:
-                inverse = inverse * permutations[generator]
-            inverses[name] = elements[name_lookup[inverse]]
+    def _set_arrays(self, values, lengths, prefix, last_generator, right_mul,
+                    inverse_index):
+        """Names the elements and fills in the integer tables, given the
+        arrays returned by _generate_arrays"""
+        generator_names = self.generator_names
+        elements = self.elements
+
+        # Names are built layer by layer, so prefixes are named first
+        names = self.names
+        for index in range(len(values)):
+            if index == 0:
+                names.append('e')
+            elif prefix[index] == 0:
+                names.append(generator_names[last_generator[index]])
+            else:
+                names.append(names[prefix[index]] + generator_names[last_generator[index]])
+
+        for index, (name, row) in enumerate(zip(names, values.tolist())):
+            elements[name] = CoxeterElement(self, name, index)
+            permutation = p.Permutation(row)
+            self.permutations[name] = permutation
+            self.name_lookup[permutation] = name
+        for name, inverse in zip(names, inverse_index.tolist()):
+            self.inverse[name] = elements[names[inverse]]
+
+        # Generator multiplication tables. Left multiplication follows from
+        # s * w = (w^-1 * s)^-1.
+        self.permutation_array = values
+        self.prefix = prefix
+        self.last_generator = last_generator
+        self.right_mul = right_mul
+        self.inverse_index = inverse_index
+        self.left_mul = inverse_index[right_mul[inverse_index]]
+        self.lengths = lengths
+        bits = np.left_shift(1, np.arange(len(generator_names), dtype=np.int64))
+        self.right_descents = (lengths[right_mul] < lengths.reshape(-1, 1)).dot(bits)
+        self.left_descents = (lengths[self.left_mul] < lengths.reshape(-1, 1)).dot(bits)
 
         # Add identity and longest element
-        group.identity = elements['e']
-        longest_name = sorted(elements.keys(), key=lambda x: (len(x), x))[-1]
-        group.longest = elements[longest_name]
+        self.identity = elements['e']
+        self.longest = elements[names[-1]]
+
+    def save(self, directory):
+        """
+        Saves the generators, the integer tables and, if it has been
+        generated, the Bruhat order as .npy files in 'directory'.
+        """
+        np.save(os.path.join(directory, 'generator_names.npy'),
+                np.array(self.generator_names))
+        np.save(os.path.join(directory, 'generator_values.npy'),
+                np.array([self.generators[name].values
+                          for name in self.generator_names]))
+        for name in _SAVED_ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        if self._bruhat_order is not None:
+            np.save(os.path.join(directory, 'bruhat_below.npy'),
+                    self._bruhat_order.below)
 
+    @staticmethod
+    def load(directory):
+        """Loads a group saved by save(), with the tables memory mapped"""
+        generator_names = np.load(
+            os.path.join(directory, 'generator_names.npy')).tolist()
+        generator_values = np.load(
+            os.path.join(directory, 'generator_values.npy')).tolist()
+        group = CoxeterGroup({name: p.Permutation(values) for name, values
+                              in zip(generator_names, generator_values)},
+                             dict(), dict(), dict(), dict())
+        group._set_arrays(*[np.load(os.path.join(directory, name + '.npy'),
+                                    mmap_mode='r')
+                            for name in _SAVED_ARRAYS])
+        below = os.path.join(directory, 'bruhat_below.npy')
+        if os.path.exists(below):
+            group._bruhat_order = b.BruhatOrder(
+                group, below=np.load(below, mmap_mode='r'))
         return group
 
+    def bruhat_order(self):
+        """Returns the Bruhat order, generating it the first time."""
+        if self._bruhat_order is None:
+            self._bruhat_order = b.BruhatOrder(self)
+        return self._bruhat_order
+
+    def bruhat_le(self, x, y):
+        """Returns True if x <= y in the Bruhat order. x and y can be names
+        or indices."""
+        return self.bruhat_order().le(self.index(x), self.index(y))
+
+    def bruhat_interval(self, y, w):
+        """Iterates over the elements of the Bruhat interval [y, w]"""
+        for x in self.bruhat_order().interval(self.index(y), self.index(w)):
+            yield self[x]
+
     def all_generators(self):
         """Returns the generators, ordered by name"""
         if self._all_generators is None:
@@ -145,14 +284,97 @@ class CoxeterGroup:
         return self._all_generators
 
     def all_elements(self):
-        """Returns the elements, ordered by (len(nate), name)"""
+        """Returns the elements, ordered by index, i.e. by (length, name)"""
         if self._all_elements is None:
-            self._all_elements = [self.elements[key]
-                                  for key
-                                  in sorted(self.elements.keys(), key=lambda x: (len(x), x))]
+            self._all_elements = [self.elements[name] for name in self.names]
         return self._all_elements
 
 
+def _row_keys(rows):
+    """Returns a 1d array of opaque keys, one per row of the 2d array
+    'rows', such that equal rows have equal keys."""
+    rows = np.ascontiguousarray(rows)
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+
+
+def _generate_arrays(generators):
+    """
+    Generates all elements of the group generated by the signed permutations
+    'generators' (lists of values, sorted by generator name), one length at
+    a time. Each layer is held as a 2d array with one signed permutation
+    per row, and is multiplied by all generators at once.
+
+    Returns (values, lengths, prefix, last_generator, right_mul,
+    inverse_index), where values[index] is the permutation of the element
+    with the given index, element index = prefix[index] *
+    generator[last_generator[index]], and the rest are as on CoxeterGroup.
+    """
+    generators = np.array(generators)
+    k, m = generators.shape
+    dtype = np.int8 if m < 128 else np.int32
+    columns = np.abs(generators) - 1
+    signs = np.sign(generators).astype(dtype)
+
+    identity = np.arange(1, m + 1, dtype=dtype).reshape(1, m)
+    layers = [identity]
+    lengths = [np.zeros(1, dtype=np.int32)]
+    prefix = [np.zeros(1, dtype=np.int32)]
+    last_generator = [np.full(1, -1, dtype=np.int32)]
+    right_mul = []
+    previous = np.zeros((0, m), dtype=dtype)
+    previous_indices = np.zeros(0, dtype=np.int32)
+    layer = identity
+    layer_indices = np.zeros(1, dtype=np.int32)
+    n = 1
+    while len(layer) > 0:
+        # (p * g)[i] = p[|g[i]| - 1] * sgn(g[i]). Rows are ordered by
+        # (parent, generator), which keeps the names in each layer sorted.
+        candidates = (layer[:, columns] * signs).reshape(-1, m)
+        # In a Coxeter group w * s is one shorter or one longer than w, so
+        # only the previous layer (and this one) can contain it already.
+        known = np.concatenate([previous, layer])
+        known_indices = np.concatenate([previous_indices, layer_indices])
+        _, first, groups = np.unique(
+            _row_keys(np.concatenate([known, candidates])),
+            return_index=True, return_inverse=True)
+        groups = groups.reshape(-1)
+        is_new = first >= len(known)
+        new_first = np.sort(first[is_new]) - len(known)
+        group_index = np.empty(len(first), dtype=np.int32)
+        group_index[~is_new] = known_indices[first[~is_new]]
+        order = np.argsort(first[is_new])
+        group_index[np.flatnonzero(is_new)[order]] = np.arange(
+            n, n + len(new_first), dtype=np.int32)
+        right_mul.append(group_index[groups[len(known):]].reshape(-1, k))
+
+        previous, previous_indices = layer, layer_indices
+        layer = candidates[new_first]
+        layer_indices = np.arange(n, n + len(new_first), dtype=np.int32)
+        layers.append(layer)
+        lengths.append(np.full(len(layer), len(lengths), dtype=np.int32))
+        prefix.append(previous_indices[new_first // k])
+        last_generator.append((new_first % k).astype(np.int32))
+        n += len(new_first)
+
+    values = np.concatenate(layers)
+    # Layers are generated in index order, so the rows of right_mul are too
+    right_mul = np.concatenate(right_mul)
+
+    # Inverse of a signed permutation: inverse[|p[i]| - 1] = (i + 1) * sgn(p[i])
+    inverses = np.empty_like(values)
+    inverses[np.arange(n).reshape(-1, 1), np.abs(values) - 1] = (
+        np.arange(1, m + 1, dtype=dtype) * np.sign(values))
+    _, groups = np.unique(_row_keys(np.concatenate([values, inverses])),
+                          return_inverse=True)
+    groups = groups.reshape(-1)
+    group_index = np.empty(n, dtype=np.int32)
+    group_index[groups[:n]] = np.arange(n, dtype=np.int32)
+    inverse_index = group_index[groups[n:]]
+
+    return (values, np.concatenate(lengths), np.concatenate(prefix),
+            np.concatenate(last_generator), right_mul, inverse_index)
+
+
 def generate_a1():
     return CoxeterGroup.generate({'s': p.Permutation([2, 1])})
 
@@ -245,9 +467,10 @@ def generate_d5():
 
 
 def generate_g2():
+    # The dihedral group of order 12, as S_3 times the sign -1
     return CoxeterGroup.generate({
-        'r': p.Permutation([1, 1]),
-        's': p.Permutation([1, -2])
+        'r': p.Permutation([2, 1, 3]),
+        's': p.Permutation([-1, -3, -2])
     })
 
 # G_2
@@ -0,0 +1,140 @@
+import numpy as np
+
+"""
+Directed graphs on the vertices 0, ..., n - 1, given by a list (or map) of
+the successors of each vertex. Everything here is iterative, so there is no
+limit on the depth of the graph, and sets of vertices are stored as Python
+int bitsets with bit x set for vertex x.
+"""
+
+
+def strongly_connected_components(successors):
+    """
+    Tarjan's algorithm. Returns (labels, components), where components is
+    the list of strongly connected components (lists of vertices) in
+    reverse topological order, i.e. every edge goes from a component to
+    itself or an earlier one, and labels[x] is the position of the component
+    of x.
+    """
+    n = len(successors)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    labels = [-1] * n
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(successors[root]))]
+        while work:
+            x, remaining = work[-1]
+            for y in remaining:
+                if index[y] < 0:
+                    index[y] = low[y] = counter
+                    counter += 1
+                    stack.append(y)
+                    on_stack[y] = True
+                    work.append((y, iter(successors[y])))
+                    break
+                elif on_stack[y] and index[y] < low[x]:
+                    low[x] = index[y]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[x] < low[parent]:
+                        low[parent] = low[x]
+                if low[x] == index[x]:
+                    component = []
+                    while True:
+                        y = stack.pop()
+                        on_stack[y] = False
+                        labels[y] = len(components)
+                        component.append(y)
+                        if y == x:
+                            break
+                    components.append(component)
+    return labels, components
+
+
+def condensation(successors, labels, count):
+    """
+    Returns the list of the sets of successor components of each of the
+    'count' components, without loops.
+    """
+    ret = [set() for _ in range(count)]
+    for x, label in enumerate(labels):
+        targets = ret[label]
+        for y in successors[x]:
+            if labels[y] != label:
+                targets.add(labels[y])
+    return ret
+
+
+def reachability(successors):
+    """
+    Returns (labels, components, reach), with labels and components as in
+    strongly_connected_components and reach[c] the bitset of the vertices
+    reachable from component c (including c).
+    """
+    labels, components = strongly_connected_components(successors)
+    dag = condensation(successors, labels, len(components))
+    reach = [0] * len(components)
+    # Successor components come first
+    for c, component in enumerate(components):
+        bits = 0
+        for x in component:
+            bits |= 1 << x
+        for d in dag[c]:
+            bits |= reach[d]
+        reach[c] = bits
+    return labels, components, reach
+
+
+def bitsets_to_matrix(bitsets, n):
+    """Returns the bool array of shape (len(bitsets), n) with [i, x] set if
+    bit x of bitsets[i] is set"""
+    return _unpack(_pack(bitsets, n), n)
+
+
+def _pack(bitsets, n):
+    """Returns the bitsets as rows of little endian bytes"""
+    size = (n + 7) // 8
+    data = b''.join(bits.to_bytes(size, 'little') for bits in bitsets)
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(bitsets), size)
+
+
+def _unpack(packed, n):
+    """Expands rows of little endian bytes into bool rows of length n"""
+    # unpackbits gives the most significant bit of each byte first
+    ret = np.unpackbits(_REVERSED[packed], axis=1)[:, :n].view(bool)
+    if n % 8:
+        ret = np.ascontiguousarray(ret)
+    return ret
+
+
+# _REVERSED[b] is the byte b with the order of its bits reversed
+_REVERSED = np.packbits(
+    (np.arange(256).reshape(-1, 1) >> np.arange(8)) & 1, axis=1).ravel()
+
+
+def transitive_closure(successors):
+    """
+    Returns the n x n bool array 'order' with order[y, x] set if y can be
+    reached from x (including y = x).
+    """
+    # Row y of the order is the set of vertices from which y can be reached,
+    # i.e. the set reachable from y in the reversed graph.
+    n = len(successors)
+    predecessors = [[] for _ in range(n)]
+    for x in range(n):
+        for y in successors[x]:
+            predecessors[y].append(x)
+    labels, _, reach = reachability(predecessors)
+    return _unpack(_pack(reach, n)[labels], n)
@@ -1,18 +1,103 @@
+import collections
+import heapq
+import jk.hecke.cells as ce
+import jk.hecke.coxeter as cox
+import jk.hecke.graph as gr
+import jk.hecke.kl as kl
 import jk.hecke.laurent as l
-import copy
+import jk.hecke.matrix as m
+import jk.hecke.structure as st
+import jk.hecke.wgraph as wg
 import numpy as np
+import os
 import time
 
+# Default bound on the total number of terms of the cached products H_x * H_y
+DEFAULT_CACHE_SIZE = 2 ** 20
+
 
 class HeckeAlgebra:
-    def __init__(self, group):
+    def __init__(self, group, arithmetic='exact', cache_size=DEFAULT_CACHE_SIZE,
+                 backend='dict', inverse_matrices=True, workers=None):
+        """
+        :param group: The CoxeterGroup.
+        :param arithmetic: 'exact' computes the Kazhdan-Lusztig polynomials
+            with integer Laurent polynomials, 'modular' modulo several primes
+            followed by Chinese remaindering. Both give the same results.
+        :param cache_size: The maximal total number of terms of the products
+            H_x * H_y kept in the product cache. 0 disables the cache.
+        :param backend: The storage of the elements created by element() and
+            get_standard_basis_element(): 'dict' for a HeckeElement, a map
+            from element index to Laurent polynomial, or 'dense' for a
+            DenseHeckeElement, an integer array over all elements and a
+            window of degrees.
+        :param inverse_matrices: If True, the change of basis matrices from
+            the standard basis to the KL and dual KL bases are computed on the
+            first decomposition into these bases and cached, so that further
+            decompositions are sparse matrix-vector products.
+        :param workers: The number of processes computing the exact
+            Kazhdan-Lusztig polynomials, by length layer, and the edges of
+            the W-graph.
+        """
+        if arithmetic not in ('exact', 'modular'):
+            raise Exception(f'Unknown arithmetic {arithmetic}')
+        if backend not in ('dict', 'dense'):
+            raise Exception(f'Unknown backend {backend}')
         self.group = group
+        self.arithmetic = arithmetic
+        self.backend = backend
+        self.inverse_matrices = inverse_matrices
+        self.workers = workers
         self.zero = HeckeElement(self, {})
-        self.one = HeckeElement(self, {'e': l.one})
+        self.one = HeckeElement(self, {0: l.one})
+        self._kl_polynomials = None
+        self._w_graph = None
+        self._right_cells = None
+        self._left_cells = None
+        self._two_sided_cells = None
         self._kl_basis = None
         self._dual_kl_basis = None
+        self._kl_inverse_matrix = None
+        self._dual_kl_inverse_matrix = None
+        self._standard_dual_matrix = None
+        # Map tuple of x (or None for all) -> KLStructureConstants
+        self._structure_constants = dict()
         self._left_order = None
         self._right_order = None
+        self.product_cache = ProductCache(cache_size)
+
+        # The actions of H_s on the standard basis, as sparse operators:
+        # H_w H_s = H_ws, plus (v^-1 - v) H_w if ws < w, and similarly on
+        # the left. Stored per generator position as the list of targets
+        # ws (sw) and the list of descent flags of w.
+        k = len(group.generator_names)
+        self._right_action = [
+            (group.right_mul[:, s].tolist(),
+             ((group.right_descents >> s) & 1).astype(bool).tolist())
+            for s in range(k)]
+        self._left_action = [
+            (group.left_mul[:, s].tolist(),
+             ((group.left_descents >> s) & 1).astype(bool).tolist())
+            for s in range(k)]
+        # Reduced decompositions x = prefix * s and x = s * rest, with s
+        # the last letter of the name and the first left descent.
+        self._prefix = group.prefix.tolist()
+        self._last_generator = group.last_generator.tolist()
+        self._first_generator = [(d & -d).bit_length() - 1
+                                 for d in group.left_descents.tolist()]
+        self._rest = [int(group.left_mul[x, s]) if s >= 0 else 0
+                      for x, s in enumerate(self._first_generator)]
+        self._lengths = group.lengths.tolist()
+        # The same actions as numpy arrays, and the trees of reduced words,
+        # used by the dense multiplication
+        self._dense_right_action = [
+            (group.right_mul[:, s], ((group.right_descents >> s) & 1).astype(bool))
+            for s in range(k)]
+        self._dense_left_action = [
+            (group.left_mul[:, s], ((group.left_descents >> s) & 1).astype(bool))
+            for s in range(k)]
+        self._prefix_children = None
+        self._rest_children = None
 
     def element(self, d):
         """
@@ -20,202 +105,466 @@ class HeckeAlgebra:
         :param d:
         :return:
         """
-        return HeckeElement(self, d)
+        ret = HeckeElement(self, d)
+        if self.backend == 'dense':
+            return ret.to_dense()
+        return ret
+
+    def word(self, element):
+        """Returns the reduced word of an element as a list of generator
+        element indices."""
+        generators = self.group.right_mul[0]
+        word = self.group.word(self.group.index(element))
+        return [int(generators[s]) for s in word]
 
     def simple_mul(self, thiselement, otherelement):
         """
         Calculates the product H_x*H_y.
         """
-        if otherelement == 'e' or otherelement == '':
-            return self.get_standard_basis_element(thiselement)
-        else:
-            s = otherelement[0]
-            prod = self.simple_simple_mul(thiselement, s)
-            return prod * HeckeElement(self, {otherelement[1:]: l.one})
+        return self.multiply(self._standard(thiselement),
+                             self._standard(otherelement))
 
     def simple_simple_mul(self, thiselement, s):
-        w = self.group[thiselement]
-        s = self.group[s]
-        ws = w * s
-        if ws.length() > w.length():
-            return HeckeElement(self, {ws.name: l.one})
+        # The last generator of a generator is its position
+        s = self._last_generator[self.group.index(s)]
+        return self.right_action(self._standard(thiselement), s)
+
+    def right_action(self, element, s):
+        """Returns element * H_s, for the generator at position s"""
+        return HeckeElement.from_terms(
+            self, _apply_action(self._right_action[s], element.terms))
+
+    def left_action(self, s, element):
+        """Returns H_s * element, for the generator at position s"""
+        return HeckeElement.from_terms(
+            self, _apply_action(self._left_action[s], element.terms))
+
+    def multiply(self, a, b):
+        """
+        Returns the product a * b of two HeckeElements. If one of them has a
+        single term, such as a standard basis element, this is a sum of
+        products H_x * H_y from the product cache (if enabled). Otherwise
+        either a * H_y is computed for each y in the support of b by applying
+        the right action of the letters of y to all of a, or H_x * b for each
+        x in the support of a using left actions, whichever needs fewer term
+        operations. Products for shared prefixes are only computed once.
+        """
+        if self.product_cache.max_terms > 0 and (len(a.terms) == 1 or
+                                                 len(b.terms) == 1):
+            ret = HeckeAccumulator(self)
+            for x, a_coeff in a.terms.items():
+                for y, b_coeff in b.terms.items():
+                    ret.add_scaled_terms(self._product_terms(x, y),
+                                         a_coeff * b_coeff)
+            return ret.element()
+
+        lengths = self._lengths
+        right_cost = len(a.terms) * sum(lengths[y] for y in b.terms)
+        left_cost = len(b.terms) * sum(lengths[x] for x in a.terms)
+        ret = HeckeAccumulator(self)
+        if right_cost <= left_cost:
+            # products[y] = a * H_y
+            products = {0: a.terms}
+
+            def product(y):
+                terms = products.get(y)
+                if terms is None:
+                    s = self._last_generator[y]
+                    terms = _apply_action(self._right_action[s],
+                                          product(self._prefix[y]))
+                    products[y] = terms
+                return terms
+
+            for y, coeff in b.terms.items():
+                ret.add_scaled_terms(product(y), coeff)
         else:
-            return HeckeElement(self, {
-                ws.name: l.one,
-                w.name: l.Laurent({-1: 1, 1: -1})
-            })
+            # products[x] = H_x * b
+            products = {0: b.terms}
+
+            def product(x):
+                terms = products.get(x)
+                if terms is None:
+                    s = self._first_generator[x]
+                    terms = _apply_action(self._left_action[s],
+                                          product(self._rest[x]))
+                    products[x] = terms
+                return terms
+
+            for x, coeff in a.terms.items():
+                ret.add_scaled_terms(product(x), coeff)
+        return ret.element()
+
+    def _product_terms(self, x, y):
+        """
+        Returns the terms of H_x * H_y, using and filling the product cache.
+        The product is H_x * H_y' * H_s for y = y's if y is not longer than x,
+        else H_s * H_x' * H_y for x = sx'. The returned map must not be
+        modified.
+        """
+        if x == 0:
+            return {y: l.one}
+        if y == 0:
+            return {x: l.one}
+        key = (x, y)
+        ret = self.product_cache.get(key)
+        if ret is None:
+            if self._lengths[y] <= self._lengths[x]:
+                ret = _apply_action(self._right_action[self._last_generator[y]],
+                                    self._product_terms(x, self._prefix[y]))
+            else:
+                ret = _apply_action(self._left_action[self._first_generator[x]],
+                                    self._product_terms(self._rest[x], y))
+            self.product_cache.put(key, ret)
+        return ret
+
+    def cache_info(self):
+        """Returns the statistics of the product cache."""
+        return self.product_cache.info()
+
+    def multiply_dense(self, a, b):
+        """
+        Returns the product a * b of two DenseHeckeElements, as the sum of
+        a * H_y over the support of b (or of H_x * b over the support of a),
+        where the products are computed by applying the vectorized generator
+        actions while walking the tree of reduced words.
+        """
+        group = self.group
+        n = len(group.names)
+        support_a = np.flatnonzero(a.coefficients.any(axis=1)).tolist()
+        support_b = np.flatnonzero(b.coefficients.any(axis=1)).tolist()
+        if not support_a or not support_b:
+            return DenseHeckeElement(self, 0, np.zeros((n, 0), dtype=np.int64))
+        if self._prefix_children is None:
+            self._prefix_children = _children(self._prefix)
+            self._rest_children = _children(self._rest)
+
+        right_nodes = _ancestors(support_b, self._prefix)
+        left_nodes = _ancestors(support_a, self._rest)
+        if len(right_nodes) <= len(left_nodes):
+            products = _dense_products(
+                a, right_nodes, self._prefix_children, self._last_generator,
+                self._dense_right_action)
+            scalars = b
+        else:
+            products = _dense_products(
+                b, left_nodes, self._rest_children, self._first_generator,
+                self._dense_left_action)
+            scalars = a
+
+        # Every product has degrees within max length of those of the factor
+        length = int(group.lengths.max())
+        offset = a.offset + b.offset - length
+        ret = np.zeros((n, a.coefficients.shape[1] + b.coefficients.shape[1] +
+                        2 * length), dtype=np.int64)
+        for y, product in products:
+            row = scalars.coefficients[y]
+            for d in np.flatnonzero(row).tolist():
+                start = product.offset + scalars.offset + d - offset
+                ret[:, start:start + product.coefficients.shape[1]] += \
+                    int(row[d]) * product.coefficients
+        return DenseHeckeElement(self, offset, ret)
 
     def get_standard_basis_element(self, element):
         """Returns a standard basis element H_x"""
-        if element not in self.group.elements:
+        if isinstance(element, str) and element not in self.group.elements:
             raise Exception(f"Can't create standard basis element for {element}.")
-        return HeckeElement(self, {element: l.one})
+        ret = self._standard(element)
+        if self.backend == 'dense':
+            return ret.to_dense()
+        return ret
+
+    def _standard(self, element):
+        """Returns H_x as a HeckeElement, whatever the backend"""
+        return HeckeElement.from_terms(self, {self.group.index(element): l.one})
 
     def get_standard_inverse_element(self, element):
-        if element not in self.group.elements:
-            raise Exception(f"Can't create standard inverse element for {element}.")
-        ret = self.one
-        for generator in element[::-1]:
-            ret *= self.get_generator_inverse_element(generator)
-        return ret
+        # H_x^-1 is the bar involution of H_{x^-1}
+        x = int(self.group.inverse_index[self.group.index(element)])
+        return HeckeElement.from_terms(
+            self, dict(self.standard_dual_matrix().columns[x]))
 
     def get_generator_inverse_element(self, generator):
-        return self.element({
-            'e': l.Laurent({-1: -1, 1: 1}),
-            generator: l.one
+        return HeckeElement(self, {
+            0: l.v_minus_v_inverse,
+            self.group.index(generator): l.one
         })
 
     def get_standard_dual(self, element):
-        if element not in self.group.elements:
-            raise Exception(f"Can't create standard inverse element for {element}.")
-        ret = self.one
-        for generator in element:
-            ret *= self.get_generator_inverse_element(generator)
-        return ret
+        x = self.group.index(element)
+        return HeckeElement.from_terms(
+            self, dict(self.standard_dual_matrix().columns[x]))
 
-    def generate_kl_basis(self):
-        if self._kl_basis is None:
-            n = len(self.group.all_elements())
-            ret = dict()
+    def standard_dual_matrix(self):
+        """
+        Returns the PolynomialMatrix of the bar involution on the standard
+        basis: column x holds the coefficients of the dual of H_x, whose
+        entries are the R-polynomials of the group. With x = x's for the
+        last letter s of x,
+            dual(H_x) = dual(H_x') (H_s + v - v^-1).
+        """
+        if self._standard_dual_matrix is None:
+            columns = [{0: l.one}]
+            start = time.time()
+            for x in range(1, len(self.group.names)):
+                previous = columns[self._prefix[x]]
+                column = _apply_action(
+                    self._right_action[self._last_generator[x]], previous)
+                for y, coeff in previous.items():
+                    coeff = column.get(y, l.zero) + coeff * l.v_minus_v_inverse
+                    if coeff != l.zero:
+                        column[y] = coeff
+                    else:
+                        column.pop(y, None)
+                columns.append(column)
 
-            # Add identity
-            ret['e'] = self.get_standard_basis_element('e')
+                difftime = time.time() - start
+                if difftime > 5.0:
+                    print('Standard duals generated ' + '{:2.2f}%'.format(
+                        100 * (x + 1) / len(self.group.names)))
+                    start = time.time()
+            self._standard_dual_matrix = m.PolynomialMatrix(columns)
+        return self._standard_dual_matrix
 
-            # Add generators
-            for generator in self.group.generators:
-                ret[generator] = (
-                        self.get_standard_basis_element(generator) +
-                        self.get_standard_basis_element('e') * l.Laurent({1: 1})
-                )
+    def kl_polynomials(self):
+        """Returns the table of Kazhdan-Lusztig polynomials h_{y,w}"""
+        if self._kl_polynomials is None:
+            if self.arithmetic == 'modular':
+                self._kl_polynomials = kl.KLPolynomials(self.group,
+                                                        primes=kl.PRIMES)
+            else:
+                self._kl_polynomials = kl.KLPolynomials(self.group,
+                                                        workers=self.workers)
+        return self._kl_polynomials
 
-            # Add the rest
-            start = time.time()
-            for i, name in enumerate(sorted(self.group.elements.keys(),
-                                            key=lambda str: (len(str), str))):
-                if name not in ret:
-                    x = name[:-1]
-                    kl_x = ret[x]
-                    s = name[-1]
-                    kl_s = ret[s]
-                    # Now x < xs
-                    xs = name
-                    kl_xs = kl_x * kl_s
-                    sub = self.zero
-                    if xs not in ret:
-                        # Subtract all y[1] with ys < y:
-                        for y, coef in kl_x.elements.items():
-                            if 1 in coef and (self.group[y] * self.group[s]).length() < self.group[y].length():
-                                sub -= ret[y] * coef[1]
-                        ret[xs] = kl_xs + sub
-                    difftime = time.time() - start
-                    if difftime > 5.0:
-                        print('KL-basis generated ' + '{:2.2f}%'.format(
-                            100 * (i + 1) / n))
-                        start = time.time()
-
-            self._kl_basis = ret
+    def kl_inverse_matrix(self):
+        """
+        Returns the PolynomialMatrix with column x the coefficients of H_x in
+        the KL basis. By Kazhdan-Lusztig inversion
+            H_x = sum_{y <= x} (-1)^(l(x) + l(y)) h_{xw0,yw0} C_y.
+        """
+        if self._kl_inverse_matrix is None:
+            table = self.kl_polynomials().table
+            times_longest = self.group.bruhat_order().times_longest().tolist()
+            lengths = self._lengths
+            columns = [dict() for _ in table]
+            for w, h_w in enumerate(table):
+                y = times_longest[w]
+                for z, p in h_w.items():
+                    if (lengths[z] + lengths[w]) % 2:
+                        p = -p
+                    columns[times_longest[z]][y] = p
+            self._kl_inverse_matrix = m.PolynomialMatrix(columns)
+        return self._kl_inverse_matrix
+
+    def dual_kl_inverse_matrix(self):
+        """
+        Returns the PolynomialMatrix with column x the coefficients of H_x in
+        the dual KL basis, which are H_x = sum_{y >= x} h_{x,y} D_y.
+        """
+        if self._dual_kl_inverse_matrix is None:
+            table = self.kl_polynomials().table
+            columns = [dict() for _ in table]
+            for y, h_y in enumerate(table):
+                for x, p in h_y.items():
+                    columns[x][y] = p
+            self._dual_kl_inverse_matrix = m.PolynomialMatrix(columns)
+        return self._dual_kl_inverse_matrix
+
+    def kl_structure_constants(self, xs=None):
+        """
+        Returns the KLStructureConstants h_{x,y,z} with
+        C_x C_y = sum_z h_{x,y,z} C_z, for x in xs (element names or indices,
+        all elements if None) and all y.
+        """
+        key = None if xs is None else tuple(sorted({self.group.index(x) for x in xs}))
+        ret = self._structure_constants.get(key)
+        if ret is None:
+            ret = st.KLStructureConstants.compute(self, key)
+            self._structure_constants[key] = ret
+        return ret
+
+    def generate_kl_basis(self):
+        if self._kl_basis is None:
+            # C_w = sum_y h_{y,w} H_y, with C_w = H_w plus shorter terms
+            table = self.kl_polynomials().table
+            self._kl_basis = Basis(self, _TableElements(self, table),
+                                   use_inverse=self.inverse_matrices,
+                                   inverse_matrix=self.kl_inverse_matrix,
+                                   order=list(range(len(table) - 1, -1, -1)))
         return self._kl_basis
 
-    def generate_dual_kl_basis(self):
+    def generate_dual_kl_basis(self, method='inversion'):
+        """
+        Returns the dual KL basis. With method 'inversion' it is read off the
+        inverse of the KL matrix, D_x = sum_y G_{x,y} H_y where
+        H_x = sum_y G_{y,x} C_y (see kl_inverse_matrix), so no Hecke algebra
+        products are needed. With method 'recursion' it is computed
+        downwards from the longest element using products with C_s.
+        """
+        if method not in ('inversion', 'recursion'):
+            raise Exception(f'Unknown method {method}')
+        if self._dual_kl_basis is None and method == 'inversion':
+            columns = self.kl_inverse_matrix().transpose().columns
+            self._dual_kl_basis = Basis(
+                self, [HeckeElement.from_terms(self, dict(column))
+                       for column in columns],
+                use_inverse=self.inverse_matrices,
+                inverse_matrix=self.dual_kl_inverse_matrix)
         if self._dual_kl_basis is None:
             kl_basis = self.generate_kl_basis()
-            n = len(self.group.all_elements())
-            ret = dict()
+            group = self.group
+            n = len(group.all_elements())
+            ret = [None] * n
 
             # Add longest element
-            ret[self.group.longest.name] = self.get_standard_basis_element(self.group.longest.name)
+            ret[group.longest.index] = self._standard(group.longest.index)
 
             start = time.time()
-            # Add the rest
-            for i, name in enumerate(sorted(self.group.elements.keys(),
-                                            key=lambda str: (len(str), str),
-                                            reverse=True)):
-                x = self.group[name]
-                for generator in self.group.generators.keys():
-                    s = self.group[generator]
-                    xs = x * s
-                    if xs.length() < x.length() and xs.name not in ret:
-                        dkl_x = ret[x.name]
+            # Add the rest, from the longest element down
+            for i, x in enumerate(range(n - 1, -1, -1)):
+                for position, generator in enumerate(group.right_mul[0].tolist()):
+                    xs = int(group.right_mul[x, position])
+                    if group.is_right_descent(x, position) and ret[xs] is None:
+                        dkl_x = ret[x]
                         kl_s = kl_basis[generator]
                         dkl_xs = dkl_x * kl_s
-                        sub = dkl_x * l.Laurent({-1: 1, 1: 1})
+                        sub = dkl_x * l.v_plus_v_inverse
                         # Subtract all y[1] with ys > y:
-                        for y, coef in dkl_x.elements.items():
-                            if 1 in coef and (self.group[y] * self.group[s.name]).length() > self.group[y].length():
+                        for y, coef in dkl_x.terms.items():
+                            if 1 in coef and not group.is_right_descent(y, position):
                                 sub -= ret[y] * coef[1]
-                        ret[xs.name] = dkl_xs - sub
+                        ret[xs] = dkl_xs - sub
                 difftime = time.time() - start
                 if difftime > 5.0:
                     print('Dual KL-basis generated ' + '{:2.2f}%'.format(100 * (i + 1) / n))
                     start = time.time()
 
-            self._dual_kl_basis = ret
+            self._dual_kl_basis = Basis(self, ret, use_inverse=self.inverse_matrices,
+                                        inverse_matrix=self.dual_kl_inverse_matrix)
         return self._dual_kl_basis
 
     def generate_orders(self):
-        if self._left_order is None or self._right_order is None:
+        """Returns the bool matrices (left_order, right_order), see
+        left_order() and right_order()."""
+        return self.left_order(), self.right_order()
+
+    def right_order(self):
+        """Returns the bool matrix 'order' of the right preorder, with
+        order[x, y] set if x <= y."""
+        if self._right_order is None:
             digraph = self._generate_digraph()
             self._right_order = self._order_from_digraph(digraph)
+        return self._right_order
+
+    def left_order(self):
+        """Returns the bool matrix of the left preorder, where x <= y if
+        x^-1 <= y^-1 in the right preorder."""
+        if self._left_order is None:
+            inverse = self.group.inverse_index
+            self._left_order = self.right_order()[np.ix_(inverse, inverse)]
+        return self._left_order
+
+    def w_graph(self):
+        """Returns the WGraph of the KL basis"""
+        if self._w_graph is None:
+            self._w_graph = wg.WGraph(self.group, self.kl_polynomials(),
+                                      workers=self.workers)
+        return self._w_graph
 
-            # There's probably a better way of doing this...
-            self._left_order = np.zeros(self._right_order.shape)
-            for xi, x in enumerate(self.group.all_elements()):
-                xinversei = x.inverse().index
-                for yi, y in enumerate(self.group.all_elements()):
-                    yinversei = y.inverse().index
-                    self._left_order[xi, yi] = self._right_order[xinversei, yinversei]
+    def right_cells(self):
+        """Returns the Cells of the right preorder"""
+        if self._right_cells is None:
+            digraph = self.w_graph().right_digraph()
+            self._right_cells = ce.Cells.from_digraph(
+                self.group, [digraph[x] for x in range(len(self.group.names))])
+        return self._right_cells
 
-        return self._left_order, self._right_order
+    def left_cells(self):
+        """Returns the Cells of the left preorder. x and y are in the same
+        left cell if x^-1 and y^-1 are in the same right cell."""
+        if self._left_cells is None:
+            right = self.right_cells()
+            self._left_cells = ce.Cells(
+                self.group, right.labels[self.group.inverse_index], right.dag)
+        return self._left_cells
+
+    def two_sided_cells(self):
+        """Returns the Cells of the two-sided preorder"""
+        if self._two_sided_cells is None:
+            digraph = self.w_graph().right_digraph()
+            inverse = self.group.inverse_index.tolist()
+            successors = [digraph[x] | {inverse[y] for y in digraph[inverse[x]]}
+                          for x in range(len(inverse))]
+            self._two_sided_cells = ce.Cells.from_digraph(self.group, successors)
+        return self._two_sided_cells
 
     def _generate_digraph(self):
         """
-        Returns a map element -> set of elements directly larger.
+        Returns a map element index -> set of element indices directly larger,
+        i.e. the y with C_y occurring in some C_x C_s, read off the W-graph.
         :return:
         """
-        kl_basis = self.generate_kl_basis()
         print('Generating digraph')
-        n = len(self.group.all_elements())
-        d = dict()
-        start = time.time()
-        for i, x in enumerate(self.group.all_elements()):
-            s = set()
-            for g in self.group.all_generators():
-                s.update((kl_basis[x.name] * kl_basis[g.name]).in_kl_basis().keys())
-            d[x.name] = s
-            difftime = time.time() - start
-            if difftime > 5.0:
-                print('Digram generated ' + '{:2.2f}%'.format(
-                    100 * (i + 1) / n))
-                start = time.time()
+        d = self.w_graph().right_digraph()
         print('Finished generating digraph')
         return d
 
     def _order_from_digraph(self, digraph):
-        def rec(base, x, order):
-            for yname in digraph[x.name]:
-                y = self.group[yname]
-                if not order[y.index, base.index]:
-                    order[y.index, base.index] = True
-                    rec(base, y, order)
-
+        """
+        Returns the bool array 'order' with order[y, x] set if y can be
+        reached from x in the digraph, by propagating bitsets over the
+        condensation of the digraph.
+        """
         print('Generating order from digraph')
         n = len(self.group.elements)
-        order = np.diag(np.ones(n, dtype=bool))
-        order[self.group.identity.index, self.group.identity.index] = True
-        start = time.time()
-        for i, x in enumerate(self.group.all_elements()[::-1]):
-            rec(x, x, order)
-            difftime = time.time() - start
-            if difftime > 5.0:
-                print('Order from digraph generated ' + '{:2.2f}%'.format(
-                    100 * (i + 1) / n))
-                start = time.time()
+        order = gr.transitive_closure([digraph[x] for x in range(n)])
         print('Finished generating order from digraph')
         return order
 
+    def save(self, directory):
+        """
+        Saves the group, the KL polynomials and, if they have been computed,
+        the dual KL basis and the right order as .npy files in 'directory'.
+        """
+        self.group.save(directory)
+        self.kl_polynomials().save(directory)
+        if self._dual_kl_basis is not None:
+            m.save_columns(directory, 'dual_kl_basis',
+                           [element.terms for element in self._dual_kl_basis.elements])
+        if self._right_order is not None:
+            np.save(os.path.join(directory, 'right_order.npy'),
+                    np.packbits(self._right_order, axis=1))
+
+    @staticmethod
+    def load(directory, **kwargs):
+        """
+        Loads a HeckeAlgebra saved by save(). The arrays are memory mapped,
+        and the KL polynomials and dual KL basis element of an element are
+        unpacked when first used.
+        :param kwargs: The further arguments of the HeckeAlgebra.
+        """
+        group = cox.CoxeterGroup.load(directory)
+        hecke = HeckeAlgebra(group, **kwargs)
+        hecke._kl_polynomials = kl.KLPolynomials.load(group, directory)
+        if m.columns_saved(directory, 'dual_kl_basis'):
+            # D_x = H_x plus longer terms
+            columns = m.PackedColumns(directory, 'dual_kl_basis')
+            hecke._dual_kl_basis = Basis(
+                hecke, _TableElements(hecke, columns),
+                use_inverse=hecke.inverse_matrices,
+                inverse_matrix=hecke.dual_kl_inverse_matrix,
+                order=list(range(len(columns))))
+        right_order = os.path.join(directory, 'right_order.npy')
+        if os.path.exists(right_order):
+            n = len(group.names)
+            packed = np.load(right_order, mmap_mode='r')
+            hecke._right_order = np.ascontiguousarray(
+                np.unpackbits(packed, axis=1)[:, :n].view(bool))
+        return hecke
+
     def filtration_str(self, d):
         """Returns a string repreentation of the filtration 'd'. 'd' is a
-        dictionary from element name to Laurent polynomial"""
+        dictionary from element name or index to Laurent polynomial"""
         def get_coefficient_string(value):
             if value == 1:
                 return ""
@@ -226,8 +575,9 @@ class HeckeAlgebra:
             return "\n"
 
         by_degree = dict()
-        for name in sorted(d.keys(), key=lambda x: (len(x), x)):
-            coef = d[name]
+        for index, coef in sorted((self.group.index(key), coef)
+                                  for key, coef in d.items()):
+            name = self.group.names[index]
             for degree, value in coef.items():
                 if degree in by_degree:
                     by_degree[degree] += f" {get_coefficient_string(value)}{name}"
@@ -245,6 +595,19 @@ class HeckeAlgebra:
             for deg in range(bottom, top + 1)
         ]) + "\n"
 
+    def in_basis_many(self, elements, basis):
+        """
+        Decomposes each of the HeckeElements 'elements' into 'basis' as in
+        HeckeElement.in_basis, sharing the triangular order of the basis.
+        :return: A list of dictionaries from element name to Laurent
+            polynomial.
+        """
+        if not isinstance(basis, Basis):
+            basis = Basis.from_dict(self, basis)
+        names = self.group.names
+        return [{names[x]: coeff for x, coeff in terms.items()}
+                for terms in basis.decompose_many(elements)]
+
     def basis_matrix(self, elements, basis):
         """
         Returns a matrix representing the change of basis between basis1 and
@@ -254,9 +617,10 @@ class HeckeAlgebra:
         :return:
         """
         d = dict()
-        for name, x in elements:
+        elements = list(elements)
+        decompositions = self.in_basis_many([x for _, x in elements], basis)
+        for (name, x), xb in zip(elements, decompositions):
             row = dict()
-            xb = x.in_basis(basis)
             for y in sorted(basis.keys(), key=lambda x: (len(x), x)):
                 p = xb.get(y, l.zero)
                 row[y] = p
@@ -286,31 +650,59 @@ class HeckeElement:
         """
         Initializes a hecke algebra element.
         :param group: The Hecke algebra.
-        :param elements: A map from name to Laurent polynomial.
+        :param elements: A map from element name or index to Laurent
+            polynomial.
         """
         self.hecke = hecke
-        self.elements = {element: coeff for element, coeff in elements.items()
-                         if coeff != l.zero}
+        # Map from element index to (non-zero) Laurent polynomial
+        self.terms = {hecke.group.index(element): coeff
+                      for element, coeff in elements.items()
+                      if coeff != l.zero}
+
+    @staticmethod
+    def from_terms(hecke, terms):
+        """
+        Trusted constructor, which uses 'terms' as is. It has to be a map from
+        element index to non-zero Laurent polynomial.
+        """
+        ret = HeckeElement.__new__(HeckeElement)
+        ret.hecke = hecke
+        ret.terms = terms
+        return ret
+
+    @property
+    def elements(self):
+        """The coefficients as a map from element name to Laurent
+        polynomial."""
+        names = self.hecke.group.names
+        return {names[element]: coeff for element, coeff in self.terms.items()}
 
     def deepcopy(self):
-        return HeckeElement(self.hecke, copy.deepcopy(self.elements))
+        # The coefficients are immutable
+        return HeckeElement.from_terms(self.hecke, dict(self.terms))
 
     def __add__(self, other):
-        ret = {}
-        allkeys = set(self.elements.keys()).union(other.elements.keys())
-        for key in allkeys:
-            ret[key] = self.elements.get(key, l.zero) + other.elements.get(key, l.zero)
+        if isinstance(other, DenseHeckeElement):
+            return self.to_dense() + other
+        ret = dict(self.terms)
+        for key, coeff in other.terms.items():
+            if key in ret:
+                coeff = ret[key] + coeff
+                if coeff == l.zero:
+                    del ret[key]
+                    continue
+            ret[key] = coeff
 
-        return HeckeElement(self.hecke, ret)
+        return HeckeElement.from_terms(self.hecke, ret)
 
     def __sub__(self, other):
         return self + (-other)
 
     def __neg__(self):
         ret = {}
-        for element, coeff in self.elements.items():
+        for element, coeff in self.terms.items():
             ret[element] = -coeff
-        return HeckeElement(self.hecke, ret)
+        return HeckeElement.from_terms(self.hecke, ret)
 
     def __mul__(self, other):
         if isinstance(other, int) or isinstance(other, l.Laurent):
@@ -320,47 +712,65 @@ class HeckeElement:
 
     def multiply_int(self, other):
         """Also works if other is l.Laurent"""
-        ret = self.hecke.zero
-        for thiselement, thiscoeff in self.elements.items():
-            ret += HeckeElement(self, {thiselement: thiscoeff * other})
-        return ret
+        ret = {}
+        for thiselement, thiscoeff in self.terms.items():
+            coeff = thiscoeff * other
+            if coeff != l.zero:
+                ret[thiselement] = coeff
+        return HeckeElement.from_terms(self.hecke, ret)
 
     def multiply_hecke(self, other):
-        ret = self.hecke.zero
-        for thiselement, thiscoeff in self.elements.items():
-            for otherelement, othercoeff in other.elements.items():
-                coeff = thiscoeff * othercoeff
-                ret += self.hecke.simple_mul(thiselement, otherelement) * coeff
-        return ret
+        if isinstance(other, DenseHeckeElement):
+            return self.to_dense() * other
+        return self.hecke.multiply(self, other)
 
     def shift(self, n):
-        return self * l.Laurent({n: 1})
+        return self * l.one.shift(n)
+
+    def involute(self):
+        """Applies v -> v^-1 to all coefficients"""
+        return HeckeElement.from_terms(
+            self.hecke,
+            {element: coef.involute() for element, coef in self.terms.items()})
+
+    def to_dense(self):
+        """Returns the element as a DenseHeckeElement"""
+        n = len(self.hecke.group.names)
+        if not self.terms:
+            return DenseHeckeElement(self.hecke, 0, np.zeros((n, 0), dtype=np.int64))
+        offset = min(coef.offset for coef in self.terms.values())
+        end = max(coef.offset + len(coef.coefficients)
+                  for coef in self.terms.values())
+        coefficients = np.zeros((n, end - offset), dtype=np.int64)
+        for element, coef in self.terms.items():
+            start = coef.offset - offset
+            coefficients[element, start:start + len(coef.coefficients)] = \
+                coef.coefficients
+        return DenseHeckeElement(self.hecke, offset, coefficients)
+
+    def to_dict(self):
+        return self
 
     def dual(self):
-        ret = self.hecke.zero
-        for element, coef in self.elements.items():
-            ret += self.hecke.get_standard_dual(element) * coef.involute()
-        return ret
+        duals = self.hecke.standard_dual_matrix()
+        return HeckeElement.from_terms(self.hecke, duals.apply(
+            {x: coef.involute() for x, coef in self.terms.items()}))
 
     def i(self):
         """H_x.i() = H_x^-1"""
-        ret = self.hecke.zero
-        for element, coef in self.elements.items():
-            ret += (
-                self.hecke.get_standard_basis_element(
-                    self.hecke.group[element].inverse().name
-                ) * coef
-            )
-        return ret
+        inverse = self.hecke.group.inverse_index
+        return HeckeElement.from_terms(
+            self.hecke,
+            {int(inverse[element]): coef for element, coef in self.terms.items()})
 
     def tau(self):
-        return self['e']
+        return self[0]
 
     def bottom(self):
         """Returns the set of keys that have lowest degree coefficient"""
         ret = []
         mindegree = None
-        for element, coef in self.elements.items():
+        for element, coef in self.terms.items():
             if mindegree == None or mindegree > coef.bottom():
                 mindegree = coef.bottom()
                 ret = [(element, mindegree)]
@@ -370,10 +780,12 @@ class HeckeElement:
         return ret
 
     def __getitem__(self, item):
-        return self.elements.get(item, l.zero)
+        return self.terms.get(self.hecke.group.index(item), l.zero)
 
     def __eq__(self, other):
-        return self.hecke.group == other.hecke.group and self.elements == other.elements
+        if isinstance(other, DenseHeckeElement):
+            other = other.to_dict()
+        return self.hecke.group == other.hecke.group and self.terms == other.terms
 
     def __repr__(self):
         return f'hecke.hecke.Hecke({self.hecke.group}, {self.elements})'
@@ -387,22 +799,17 @@ class HeckeElement:
         element name to Laurent polynomial, which all have to be
         :param basis:
         :param h:
-        :return:
+        :return: A dictionary from element name to Laurent polynomial.
         """
-        tmp = self.deepcopy()
-        ret = dict()
-
-        while tmp != self.hecke.zero:
-            for bottom_element, degree in tmp.bottom():
-                coeff = tmp[bottom_element][degree]
-                sub = basis[bottom_element].shift(degree) * coeff
-                ret[bottom_element] = (
-                        l.Laurent({degree: coeff}) +
-                        ret.get(bottom_element, l.zero)
-                )
-                tmp -= sub
+        names = self.hecke.group.names
+        return {names[element]: coeff
+                for element, coeff in self._in_basis(basis).items()}
 
-        return ret
+    def _in_basis(self, basis):
+        """As in_basis, but keyed on element index."""
+        if not isinstance(basis, Basis):
+            basis = Basis.from_dict(self.hecke, basis)
+        return basis.decompose(self)
 
     def in_kl_basis(self):
         basis = self.hecke.generate_kl_basis()
@@ -414,3 +821,594 @@ class HeckeElement:
 
     def dual_kl_filtration(self):
         return self.hecke.filtration_str(self.in_dual_kl_basis())
+
+
+class DenseHeckeElement:
+    """
+    A Hecke algebra element stored densely: coefficients[x, d] is the
+    coefficient of v^(offset + d) H_x, as an int64 array of shape
+    (number of elements, number of degrees). The first and last columns are
+    non-zero. The arrays are not modified after construction.
+
+    Sums, scalar multiples, shifts and involution are vectorized, products
+    use the generator actions (see HeckeAlgebra.multiply_dense). Other
+    operations go through the dict-backed HeckeElement, see to_dict().
+    """
+    def __init__(self, hecke, offset, coefficients):
+        self.hecke = hecke
+        columns = np.flatnonzero(coefficients.any(axis=0))
+        if len(columns) == 0:
+            self.offset = 0
+            self.coefficients = coefficients[:, :0]
+        else:
+            self.offset = offset + int(columns[0])
+            self.coefficients = coefficients[:, columns[0]:columns[-1] + 1]
+
+    def to_dense(self):
+        return self
+
+    def to_dict(self):
+        """Returns the element as a (dict-backed) HeckeElement"""
+        rows = np.flatnonzero(self.coefficients.any(axis=1))
+        return HeckeElement.from_terms(self.hecke, {
+            x: l.Laurent.from_coefficients(self.offset, row)
+            for x, row in zip(rows.tolist(), self.coefficients[rows].tolist())
+        })
+
+    @property
+    def terms(self):
+        return self.to_dict().terms
+
+    @property
+    def elements(self):
+        return self.to_dict().elements
+
+    def _aligned(self, other):
+        """Returns (offset, a, b) with the coefficients of self and other
+        padded to the same window of degrees"""
+        if not other.coefficients.shape[1]:
+            return self.offset, self.coefficients, other.coefficients[:, :0]
+        if not self.coefficients.shape[1]:
+            return other.offset, self.coefficients[:, :0], other.coefficients
+        offset = min(self.offset, other.offset)
+        end = max(self.offset + self.coefficients.shape[1],
+                  other.offset + other.coefficients.shape[1])
+        ret = []
+        for element in (self, other):
+            padded = np.zeros((element.coefficients.shape[0], end - offset),
+                              dtype=np.int64)
+            start = element.offset - offset
+            padded[:, start:start + element.coefficients.shape[1]] = \
+                element.coefficients
+            ret.append(padded)
+        return offset, ret[0], ret[1]
+
+    def __add__(self, other):
+        offset, a, b = self._aligned(other.to_dense())
+        if not a.shape[1]:
+            return DenseHeckeElement(self.hecke, offset, b)
+        if not b.shape[1]:
+            return DenseHeckeElement(self.hecke, offset, a)
+        return DenseHeckeElement(self.hecke, offset, a + b)
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __neg__(self):
+        return DenseHeckeElement(self.hecke, self.offset, -self.coefficients)
+
+    def __mul__(self, other):
+        if isinstance(other, int):
+            return DenseHeckeElement(self.hecke, self.offset,
+                                     self.coefficients * other)
+        elif isinstance(other, l.Laurent):
+            return self.multiply_laurent(other)
+        else:
+            return self.hecke.multiply_dense(self, other.to_dense())
+
+    def multiply_laurent(self, p):
+        n, width = self.coefficients.shape
+        ret = np.zeros((n, width + max(len(p.coefficients) - 1, 0)),
+                       dtype=np.int64)
+        for d, coef in enumerate(p.coefficients):
+            if coef != 0:
+                ret[:, d:d + width] += coef * self.coefficients
+        return DenseHeckeElement(self.hecke, self.offset + p.offset, ret)
+
+    def shift(self, n):
+        return DenseHeckeElement(self.hecke, self.offset + n, self.coefficients)
+
+    def involute(self):
+        """Applies v -> v^-1 to all coefficients"""
+        width = self.coefficients.shape[1]
+        return DenseHeckeElement(self.hecke, -(self.offset + width - 1),
+                                 self.coefficients[:, ::-1])
+
+    def i(self):
+        return DenseHeckeElement(
+            self.hecke, self.offset,
+            self.coefficients[self.hecke.group.inverse_index])
+
+    def dual(self):
+        return self.to_dict().dual().to_dense()
+
+    def tau(self):
+        return self[0]
+
+    def __getitem__(self, item):
+        return l.Laurent.from_coefficients(
+            self.offset,
+            self.coefficients[self.hecke.group.index(item)].tolist())
+
+    def __eq__(self, other):
+        other = other.to_dense()
+        return (self.hecke.group == other.hecke.group and
+                self.offset == other.offset and
+                np.array_equal(self.coefficients, other.coefficients))
+
+    def __repr__(self):
+        return f'hecke.hecke.DenseHecke({self.hecke.group}, {self.elements})'
+
+    def __str__(self):
+        return f'DenseHecke({self.hecke.group}, {self.elements})'
+
+    def in_basis(self, basis):
+        return self.to_dict().in_basis(basis)
+
+    def in_kl_basis(self):
+        return self.to_dict().in_kl_basis()
+
+    def in_dual_kl_basis(self):
+        return self.to_dict().in_dual_kl_basis()
+
+    def dual_kl_filtration(self):
+        return self.to_dict().dual_kl_filtration()
+
+
+class _TableElements:
+    """
+    The read-only list of the HeckeElements with the terms table[x], for a
+    table of maps from element index to non-zero Laurent polynomial such as
+    the KL table. Elements are created when first used and share their
+    terms with the table.
+    """
+    def __init__(self, hecke, table):
+        self.hecke = hecke
+        self.table = table
+        self._elements = [None] * len(table)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __getitem__(self, x):
+        ret = self._elements[x]
+        if ret is None:
+            ret = self._elements[x] = HeckeElement.from_terms(self.hecke, self.table[x])
+        return ret
+
+    def __iter__(self):
+        for x in range(len(self._elements)):
+            yield self[x]
+
+
+class _ElementTerms:
+    """The terms of a list of (possibly None) HeckeElements, looked up on
+    demand"""
+    def __init__(self, elements):
+        self.elements = elements
+
+    def __getitem__(self, x):
+        element = self.elements[x]
+        return None if element is None else element.terms
+
+
+def _unitriangular_order(elements):
+    """
+    Returns an order of the indices of the (non-None) HeckeElements in
+    'elements' as in Basis.order, or an empty list if there is none.
+    """
+    indices = [x for x, element in enumerate(elements) if element is not None]
+    present = set(indices)
+    successors = dict()
+    for x in indices:
+        terms = elements[x].terms
+        if terms.get(x, l.zero) != l.one or any(y not in present for y in terms):
+            return []
+        successors[x] = [y for y in terms if y != x]
+    if all(y < x for x in indices for y in successors[x]):
+        return indices[::-1]
+    if all(y > x for x in indices for y in successors[x]):
+        return indices
+    # Topological sort
+    predecessors = {x: 0 for x in indices}
+    for x in indices:
+        for y in successors[x]:
+            predecessors[y] += 1
+    ret = [x for x in indices if predecessors[x] == 0]
+    for x in ret:
+        for y in successors[x]:
+            predecessors[y] -= 1
+            if predecessors[y] == 0:
+                ret.append(y)
+    return ret if len(ret) == len(indices) else []
+
+
+def _decompose_unitriangular(element, basis_terms, rank, budget=None):
+    """
+    Decomposes 'element' into the basis with the given terms, which is
+    unitriangular with respect to 'rank': the H_x coefficient of the element
+    is final once all basis elements of lower rank have been subtracted.
+    Returns None if more than 'budget' basis terms would be subtracted.
+    """
+    tmp = HeckeAccumulator(element.hecke, element)
+    pending = []
+    for x in tmp.terms:
+        if rank[x] is None:
+            raise Exception(f'{element} is not in the span of the basis')
+        pending.append((rank[x], x))
+    heapq.heapify(pending)
+    ret = dict()
+    while pending:
+        _, x = heapq.heappop(pending)
+        coeff = tmp.terms.pop(x).laurent()
+        if coeff == l.zero:
+            continue
+        ret[x] = coeff
+        coeff = -coeff
+        if budget is not None:
+            budget -= len(basis_terms[x])
+            if budget < 0:
+                return None
+        for y, basis_coeff in basis_terms[x].items():
+            if y == x:
+                continue
+            accumulator = tmp.terms.get(y)
+            if accumulator is None:
+                accumulator = tmp.terms[y] = l.LaurentAccumulator()
+                heapq.heappush(pending, (rank[y], y))
+            accumulator.iadd_mul(basis_coeff, coeff)
+    return ret
+
+
+def _decompose_by_degree(element, basis):
+    """
+    Decomposes 'element' into a basis without a unitriangular order, by
+    repeatedly removing the terms of lowest degree. This terminates if the
+    basis elements are H_x plus terms with coefficients in vZ[v].
+    """
+    tmp = HeckeAccumulator(element.hecke, element)
+    ret = dict()
+
+    while not tmp.is_zero():
+        for bottom_element, degree in tmp.bottom():
+            coeff = tmp.terms[bottom_element][degree]
+            ret[bottom_element] = (
+                    l.Laurent.from_coefficients(degree, [coeff]) +
+                    ret.get(bottom_element, l.zero)
+            )
+            tmp.add_scaled(basis[bottom_element],
+                           l.Laurent.from_coefficients(degree, [-coeff]))
+
+    return ret
+
+
+def _children(parent):
+    """Returns the lists of children of the tree given by the parent of each
+    non-root node"""
+    ret = [[] for _ in parent]
+    for x, y in enumerate(parent):
+        if x != 0:
+            ret[y].append(x)
+    return ret
+
+
+def _ancestors(support, parent):
+    """Returns the set of the nodes of 'support' and all their ancestors"""
+    ret = {0}
+    for x in support:
+        while x not in ret:
+            ret.add(x)
+            x = parent[x]
+    return ret
+
+
+def _dense_products(element, nodes, children, letter, actions):
+    """
+    Walks the tree of reduced words depth first and yields (y, element * H_y)
+    (or H_y * element for the left tree) for all y in nodes, where the child y
+    of x is obtained by applying actions[letter[y]].
+    """
+    stack = [(0, element)]
+    while stack:
+        x, product = stack.pop()
+        yield x, product
+        for y in children[x]:
+            if y in nodes:
+                stack.append((y, _apply_dense_action(product, *actions[letter[y]])))
+
+
+def _apply_dense_action(element, targets, descents):
+    """As _apply_action, for a DenseHeckeElement."""
+    n, width = element.coefficients.shape
+    ret = np.zeros((n, width + 2), dtype=np.int64)
+    ret[:, 1:-1] = element.coefficients[targets]
+    descending = element.coefficients[descents]
+    ret[descents, :-2] += descending
+    ret[descents, 2:] -= descending
+    return DenseHeckeElement(element.hecke, element.offset - 1, ret)
+
+
+def _apply_action(action, terms):
+    """
+    Applies the action (targets, descents) of a generator H_s to the map
+    'terms' from element index to Laurent polynomial. Each pair w > ws is
+    mapped as
+        c_w H_w + c_ws H_ws -> c_w H_ws + (c_ws + (v^-1 - v) c_w) H_w.
+    """
+    targets, descents = action
+    ret = dict()
+    for w, coeff in terms.items():
+        ws = targets[w]
+        if descents[w]:
+            ret[ws] = coeff
+            coeff = coeff * l.v_inverse_minus_v
+            low = terms.get(ws)
+            if low is not None:
+                coeff = coeff + low
+            if coeff != l.zero:
+                ret[w] = coeff
+        elif ws not in terms:
+            ret[ws] = coeff
+    return ret
+
+
+class HeckeAccumulator:
+    """
+    A mutable Hecke algebra element, for summing many (scaled) elements in
+    place. The coefficients are LaurentAccumulators, and element() returns
+    the resulting HeckeElement.
+    """
+    def __init__(self, hecke, element=None):
+        self.hecke = hecke
+        # Map from element index to LaurentAccumulator
+        self.terms = dict()
+        if element is not None:
+            self.add(element)
+
+    def _get(self, x):
+        ret = self.terms.get(x)
+        if ret is None:
+            ret = self.terms[x] = l.LaurentAccumulator()
+        return ret
+
+    def add_term(self, x, coeff):
+        """self += coeff * H_x, for an element index x"""
+        self._get(x).iadd(coeff)
+
+    def add(self, element):
+        """self += element"""
+        for x, coeff in element.terms.items():
+            self._get(x).iadd(coeff)
+
+    def add_scaled(self, element, coeff):
+        """self += element * coeff, for a Laurent polynomial coeff"""
+        self.add_scaled_terms(element.terms, coeff)
+
+    def add_scaled_terms(self, terms, coeff):
+        """As add_scaled, for a map element index -> Laurent polynomial"""
+        for x, element_coeff in terms.items():
+            self._get(x).iadd_mul(element_coeff, coeff)
+
+    def is_zero(self):
+        return all(coeff.bottom() is None for coeff in self.terms.values())
+
+    def bottom(self):
+        """As HeckeElement.bottom()"""
+        ret = []
+        mindegree = None
+        for x, coeff in self.terms.items():
+            bottom = coeff.bottom()
+            if bottom is None:
+                continue
+            if mindegree is None or mindegree > bottom:
+                mindegree = bottom
+                ret = [(x, mindegree)]
+            elif mindegree == bottom:
+                ret.append((x, mindegree))
+        return ret
+
+    def element(self):
+        terms = dict()
+        for x, coeff in self.terms.items():
+            coeff = coeff.laurent()
+            if coeff != l.zero:
+                terms[x] = coeff
+        return HeckeElement.from_terms(self.hecke, terms)
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'products', 'terms', 'max_terms'])
+
+
+class ProductCache:
+    """
+    A least recently used cache of the products H_x * H_y, keyed on the pair
+    of element indices (x, y). The total number of terms of the stored
+    products is kept below max_terms; max_terms = 0 disables the cache.
+    """
+    def __init__(self, max_terms):
+        self.max_terms = max_terms
+        self.terms = 0
+        self.hits = 0
+        self.misses = 0
+        self._products = collections.OrderedDict()
+
+    def get(self, key):
+        """Returns the cached product for key, or None"""
+        ret = self._products.get(key)
+        if ret is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._products.move_to_end(key)
+        return ret
+
+    def put(self, key, product):
+        if key in self._products or len(product) > self.max_terms:
+            return
+        self._products[key] = product
+        self.terms += len(product)
+        while self.terms > self.max_terms:
+            _, evicted = self._products.popitem(last=False)
+            self.terms -= len(evicted)
+
+    def clear(self):
+        self._products.clear()
+        self.terms = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, len(self._products),
+                         self.terms, self.max_terms)
+
+    def __len__(self):
+        return len(self._products)
+
+
+class Basis:
+    """
+    A basis of the Hecke algebra, given by one HeckeElement per group
+    element. Basis elements can be looked up by element name or index, and
+    iterating over the basis gives the element names in index order.
+    """
+    def __init__(self, hecke, elements, use_inverse=False, inverse_matrix=None,
+                 order=None):
+        """
+        :param hecke: The Hecke algebra.
+        :param elements: A list of HeckeElements, indexed by element index.
+        :param use_inverse: If True, decompositions into the basis use the
+            inverse change of basis matrix, computed when first needed.
+        :param inverse_matrix: A function returning the inverse change of
+            basis matrix. By default the basis matrix is inverted.
+        :param order: The order of the basis (see order()), if known. By
+            default it is found from the elements.
+        """
+        self.hecke = hecke
+        self.elements = elements
+        self.use_inverse = use_inverse
+        self._inverse_function = inverse_matrix
+        self._order = order
+        self._inverse = None
+
+    @staticmethod
+    def from_dict(hecke, d):
+        """Creates a basis from a map element name or index -> HeckeElement"""
+        elements = [None] * len(hecke.group.names)
+        for key, element in d.items():
+            elements[hecke.group.index(key)] = element
+        return Basis(hecke, elements)
+
+    def __getitem__(self, key):
+        element = self.elements[self.hecke.group.index(key)]
+        if element is None:
+            raise KeyError(key)
+        return element
+
+    def get(self, key, default=None):
+        """Returns the basis element of 'key', or default if there is none"""
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return sum(1 for element in self.elements if element is not None)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        names = self.hecke.group.names
+        return [names[index] for index, element in enumerate(self.elements)
+                if element is not None]
+
+    def values(self):
+        return [element for element in self.elements if element is not None]
+
+    def items(self):
+        names = self.hecke.group.names
+        return [(names[index], element)
+                for index, element in enumerate(self.elements)
+                if element is not None]
+
+    def order(self):
+        """
+        Returns a list 'order' of the element indices of the basis such that
+        every basis element b_x is H_x plus terms H_y with y after x in the
+        list, or None if there is no such order. For the Kazhdan-Lusztig basis
+        this is the decreasing index order, for the dual Kazhdan-Lusztig basis
+        the increasing one.
+        """
+        if self._order is None:
+            self._order = _unitriangular_order(self.elements)
+        return self._order or None
+
+    def inverse_matrix(self):
+        """
+        Returns the PolynomialMatrix with column x the coefficients of H_x in
+        this basis. The basis has to have an order (see order()).
+        """
+        if self._inverse is None:
+            if self._inverse_function is not None:
+                self._inverse = self._inverse_function()
+            else:
+                order = self.order()
+                if order is None:
+                    raise Exception('The basis is not unitriangular')
+                self._inverse = m.PolynomialMatrix.from_basis(
+                    self).inverse_unitriangular(order)
+        return self._inverse
+
+    def decompose(self, element):
+        """
+        Returns the coefficients of 'element' in this basis, as a map from
+        element index to Laurent polynomial.
+        """
+        return self.decompose_many([element])[0]
+
+    def decompose_many(self, elements):
+        """
+        As decompose, for a list of elements. If use_inverse is set, each
+        element is decomposed by the product with the inverse matrix, unless
+        the triangular solve finishes within a quarter of the term operations
+        of that product (its operations are about twice as expensive). The
+        solve is much faster for elements with few terms in the basis, such
+        as products of KL basis elements in the KL basis.
+        """
+        order = self.order()
+        if order is None:
+            return [_decompose_by_degree(element, self) for element in elements]
+        rank = [None] * len(self.elements)
+        for position, x in enumerate(order):
+            rank[x] = position
+        basis_terms = _ElementTerms(self.elements)
+        if not self.use_inverse:
+            return [_decompose_unitriangular(element, basis_terms, rank)
+                    for element in elements]
+
+        inverse = self.inverse_matrix()
+        column_sizes = [len(column) for column in inverse.columns]
+        ret = []
+        for element in elements:
+            terms = element.terms
+            budget = sum(column_sizes[x] for x in terms) // 4
+            decomposition = _decompose_unitriangular(element, basis_terms,
+                                                     rank, budget)
+            if decomposition is None:
+                decomposition = inverse.apply(terms)
+            ret.append(decomposition)
+        return ret
@@ -0,0 +1,427 @@
+import bisect
+import collections
+import jk.hecke.laurent as l
+import jk.hecke.matrix as m
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+import time
+
+"""
+Tables of Kazhdan-Lusztig polynomials, in Soergel's normalisation where
+C_w = H_w + sum_{y < w} h_{y,w} H_y with h_{y,w} in vZ[v].
+
+For w = xs with xs > x the polynomials are given by the recursion
+    h_{z,w} = h_{zs,x} + v^-1 h_{z,x} - sum_y mu(y,x) h_{z,y}    if zs < z,
+where the sum is over y < x with ys < y and mu(y,x) is the coefficient of
+v in h_{y,x}. For the remaining z in [e, w] we use that
+h_{z,w} = v h_{zs,w} (h_{z,w} = v h_{sz,w}) whenever s is a right (left)
+descent of w but not of z, and h_{y,w} = h_{y^-1,w^-1}.
+
+The polynomials of elements of the same length only depend on those of
+shorter elements, so with several workers each length layer is computed by
+a process pool. The workers return their maps packed as in matrix.py, and
+the finished layers are written to .npy files in a temporary directory,
+which the workers map into memory.
+"""
+
+# The number of entries of h_{y,w} a worker keeps unpacked
+WORKER_CACHE_ENTRIES = 2 ** 20
+
+# Primes used by the modular engine. They are below 2^30, so products of
+# two residues, and the product of two primes, fit in an int64.
+PRIMES = [1073741789, 1073741783, 1073741741, 1073741723, 1073741719,
+          1073741717, 1073741689, 1073741671]
+
+
+class KLPolynomials:
+    def __init__(self, group, primes=None, workers=None):
+        """
+        :param group: The CoxeterGroup.
+        :param primes: If given, the polynomials are computed modulo each
+            prime in turn with fixed width numpy arithmetic, and lifted to
+            integers by Chinese remaindering. At least two primes are used,
+            and primes are added until the lift stops changing.
+        :param workers: The number of processes computing the (exact)
+            polynomials, one length layer at a time. The result is the same
+            as with one process.
+        """
+        self.group = group
+        n = len(group.names)
+        # table[w] is a map y -> h_{y,w} over the Bruhat interval [e, w]
+        self.table = [None] * n
+        if primes is not None:
+            self._generate_modular(primes)
+        elif workers is not None and workers > 1:
+            self._generate_parallel(workers)
+        else:
+            self._generate()
+
+    def __getitem__(self, w):
+        """Returns the map y -> h_{y,w}"""
+        return self.table[w]
+
+    def h(self, y, w):
+        return self.table[w].get(y, l.zero)
+
+    def mu(self, y, w):
+        """The coefficient of v in h_{y,w}"""
+        return self.table[w].get(y, l.zero)[1]
+
+    def save(self, directory):
+        """Saves the table as .npy files in 'directory'"""
+        m.save_columns(directory, 'kl', self.table)
+
+    @staticmethod
+    def load(group, directory):
+        """Loads the table of 'group' saved by save(). The table is memory
+        mapped and the maps h_w are unpacked when first used."""
+        ret = KLPolynomials.__new__(KLPolynomials)
+        ret.group = group
+        ret.table = m.PackedColumns(directory, 'kl')
+        return ret
+
+    def _generate(self):
+        n = len(self.table)
+        data = _GroupData.from_group(self.group)
+        inverse = data.inverse
+
+        self.table[0] = {0: l.one}
+        start = time.time()
+        for w in range(1, n):
+            if inverse[w] < w:
+                # h_{y,w} = h_{y^-1,w^-1}
+                self.table[w] = {inverse[y]: p
+                                 for y, p in self.table[inverse[w]].items()}
+                continue
+            self.table[w] = _column(w, self.table, data)
+
+            difftime = time.time() - start
+            if difftime > 5.0:
+                print('KL-polynomials generated ' + '{:2.2f}%'.format(
+                    100 * (w + 1) / n))
+                start = time.time()
+
+    def _generate_parallel(self, workers):
+        group = self.group
+        n = len(self.table)
+        inverse = group.inverse_index
+        lengths = group.lengths
+        with tempfile.TemporaryDirectory() as directory:
+            _GroupData.save(group, directory)
+            m.save_columns(directory, 'layer0', [{0: l.one}])
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=(directory,)) as pool:
+                start = time.time()
+                for length in range(1, int(lengths.max()) + 1):
+                    layer = np.flatnonzero(lengths == length)
+                    todo = layer[inverse[layer] >= layer].tolist()
+                    size = max(1, len(todo) // (4 * workers))
+                    chunks = [todo[i:i + size] for i in range(0, len(todo), size)]
+                    computed = m.merge_packed(pool.map(_layer_chunk, chunks))
+                    m.save_packed(directory, f'layer{length}',
+                                  _complete_layer(layer, todo, computed, inverse))
+
+                    difftime = time.time() - start
+                    if difftime > 5.0:
+                        print('KL-polynomials generated ' + '{:2.2f}%'.format(
+                            100 * (layer[-1] + 1) / n))
+                        start = time.time()
+
+            first = 0
+            for length in range(int(lengths.max()) + 1):
+                columns = m.PackedColumns(directory, f'layer{length}')
+                for x in range(len(columns)):
+                    self.table[first + x] = columns.column(x)
+                first += len(columns)
+
+    def _generate_modular(self, primes):
+        group = self.group
+        n = len(self.table)
+        lower = [group.bruhat_order().lower(w) for w in range(n)]
+
+        modulus = 1
+        lifted = None
+        previous = None
+        for p in primes:
+            residues = _residue_table(group, lower, p)
+            if lifted is None:
+                lifted = residues
+            else:
+                lifted = [_crt(a, modulus, b, p)
+                          for a, b in zip(lifted, residues)]
+            modulus *= p
+            current = [_symmetric(values, modulus) for values in lifted]
+            if previous is not None and all(
+                    np.array_equal(a, b) for a, b in zip(previous, current)):
+                break
+            previous = current
+        else:
+            raise Exception(f'Chinese remaindering did not stabilise '
+                            f'with {len(primes)} primes')
+
+        inverse = group.inverse_index.tolist()
+        for w in range(n):
+            if inverse[w] < w:
+                self.table[w] = {inverse[y]: p
+                                 for y, p in self.table[inverse[w]].items()}
+            else:
+                self.table[w] = {
+                    z: l.Laurent.from_coefficients(0, row)
+                    for z, row in zip(lower[w].tolist(), current[w].tolist())
+                }
+
+
+class _GroupData:
+    """The arrays of a CoxeterGroup used by the recursion, as lists, and the
+    packed Bruhat order ideals"""
+    NAMES = ['inverse_index', 'right_mul', 'left_mul', 'right_descents',
+             'left_descents', 'prefix', 'last_generator', 'lengths']
+
+    def __init__(self, arrays, below):
+        self.inverse = arrays['inverse_index'].tolist()
+        self.right_mul = arrays['right_mul'].tolist()
+        self.left_mul = arrays['left_mul'].tolist()
+        self.right_descents = arrays['right_descents'].tolist()
+        self.left_descents = arrays['left_descents'].tolist()
+        self.prefix = arrays['prefix'].tolist()
+        self.last_generator = arrays['last_generator'].tolist()
+        self.lengths = arrays['lengths'].tolist()
+        self.below = below
+        self.n = len(self.inverse)
+
+    @staticmethod
+    def from_group(group):
+        return _GroupData({name: getattr(group, name)
+                           for name in _GroupData.NAMES},
+                          group.bruhat_order().below)
+
+    @staticmethod
+    def save(group, directory):
+        for name in _GroupData.NAMES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(group, name))
+        np.save(os.path.join(directory, 'below.npy'), group.bruhat_order().below)
+
+    @staticmethod
+    def load(directory):
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'))
+                  for name in _GroupData.NAMES}
+        return _GroupData(arrays, np.load(os.path.join(directory, 'below.npy'),
+                                          mmap_mode='r'))
+
+    def lower(self, w):
+        """The indices of {x : x <= w}, in index order"""
+        return np.flatnonzero(np.unpackbits(self.below[w])[:self.n])
+
+
+def _column(w, table, data):
+    """
+    Returns the map z -> h_{z,w} for w with w <= w^-1, given table[y] for all
+    y shorter than w.
+    """
+    right_mul = data.right_mul
+    left_mul = data.left_mul
+    right_descents = data.right_descents
+    left_descents = data.left_descents
+    x = data.prefix[w]
+    s = data.last_generator[w]
+    h_x = table[x]
+    # mu(y,x) for y < x with ys < y
+    mus = [(table[y], p[1]) for y, p in h_x.items()
+           if y != x and p[1] != 0 and (right_descents[y] >> s) & 1]
+    right = right_descents[w]
+    left = left_descents[w]
+
+    h_w = dict()
+    # Longer elements first, so zs and sz are done before z
+    for z in data.lower(w).tolist()[::-1]:
+        missing = right & ~right_descents[z]
+        if missing:
+            t = (missing & -missing).bit_length() - 1
+            h_w[z] = h_w[right_mul[z][t]].shift(1)
+            continue
+        missing = left & ~left_descents[z]
+        if missing:
+            t = (missing & -missing).bit_length() - 1
+            h_w[z] = h_w[left_mul[z][t]].shift(1)
+            continue
+        # Now zs < z
+        p = h_x.get(right_mul[z][s], l.zero) + h_x.get(z, l.zero).shift(-1)
+        for h_y, mu in mus:
+            if z in h_y:
+                p -= h_y[z] * mu
+        h_w[z] = p
+    return h_w
+
+
+def _complete_layer(layer, todo, computed, inverse):
+    """
+    Returns the packed columns of the maps h_w for all w in the index range
+    'layer', given the packed columns 'computed' of the w in 'todo', using
+    h_{y,w} = h_{y^-1,w^-1} for the others.
+    """
+    offsets, rows, ids = computed[:3]
+    position = np.zeros(len(layer), dtype=np.int64)
+    position[np.array(todo, dtype=np.int64) - layer[0]] = np.arange(len(todo))
+    copied = inverse[layer] < layer
+    source = position[np.where(copied, inverse[layer], layer) - layer[0]]
+    counts = offsets[source + 1] - offsets[source]
+    layer_offsets = np.concatenate(([0], np.cumsum(counts)))
+    entries = (np.repeat(offsets[source] - layer_offsets[:-1], counts) +
+               np.arange(layer_offsets[-1]))
+    layer_rows = rows[entries]
+    copied = np.repeat(copied, counts)
+    layer_rows[copied] = inverse[layer_rows[copied]]
+    return [layer_offsets, layer_rows, ids[entries]] + list(computed[3:])
+
+
+class _SharedTable:
+    """
+    The table of a worker process: the maps of finished layers are read
+    from the memory mapped layer files. At most about 'capacity' entries of
+    the maps read are kept, the least recently used ones are dropped first.
+    """
+    def __init__(self, directory, lengths, capacity=WORKER_CACHE_ENTRIES):
+        self.directory = directory
+        self.lengths = lengths
+        self.capacity = capacity
+        self.layers = dict()
+        self.columns = collections.OrderedDict()
+        self.entries = 0
+
+    def _layer(self, length):
+        """The index of the first element of the layer and its columns"""
+        ret = self.layers.get(length)
+        if ret is None:
+            ret = self.layers[length] = (
+                bisect.bisect_left(self.lengths, length),
+                m.PackedColumns(self.directory, f'layer{length}'))
+        return ret
+
+    def __getitem__(self, y):
+        ret = self.columns.get(y)
+        if ret is not None:
+            self.columns.move_to_end(y)
+            return ret
+        first, columns = self._layer(self.lengths[y])
+        ret = self.columns[y] = columns.column(y - first)
+        self.entries += len(ret)
+        while self.entries > self.capacity and len(self.columns) > 1:
+            self.entries -= len(self.columns.popitem(last=False)[1])
+        return ret
+
+
+# The group data and table of a worker process
+_worker = dict()
+
+
+def _init_worker(directory):
+    data = _GroupData.load(directory)
+    _worker['data'] = data
+    _worker['table'] = _SharedTable(directory, data.lengths)
+
+
+def _layer_chunk(ws):
+    """Computes the maps h_w for the elements ws of one layer, in a worker"""
+    data = _worker['data']
+    table = _worker['table']
+    return m.pack_columns([_column(w, table, data) for w in ws])
+
+
+def _crt(a, m, b, p):
+    """Returns x mod m * p with x = a mod m and x = b mod p, for arrays a and
+    b of residues"""
+    if m * p < 2 ** 62:
+        a = a.astype(np.int64)
+        t = ((b - a % p) % p) * pow(m % p, p - 2, p) % p
+        return a + m * t
+    # Fall back to Python integers
+    a = a.astype(object)
+    t = ((b.astype(object) - a) % p) * pow(m % p, p - 2, p) % p
+    return a + m * t
+
+
+def _symmetric(values, m):
+    """Maps residues mod m to the range (-m/2, m/2]"""
+    return np.where(values > m // 2, values - m, values)
+
+
+def _residue_table(group, lower, p):
+    """
+    Returns the list of arrays h[w] of shape (len(lower[w]), l(w) + 1), with
+    h[w][i, d] the coefficient of v^d in h_{lower[w][i],w} mod p.
+    """
+    n = len(lower)
+    inverse = group.inverse_index
+    right_mul = group.right_mul
+    left_mul = group.left_mul
+    right_descents = group.right_descents
+    left_descents = group.left_descents
+    lengths = group.lengths
+    table = [None] * n
+    table[0] = np.ones((1, 1), dtype=np.int64)
+
+    def get(y, zs, width):
+        """Returns h_{z,y} for z in zs, as an array of the given width"""
+        ret = np.zeros((len(zs), width), dtype=np.int64)
+        positions = np.searchsorted(lower[y], zs)
+        positions[positions >= len(lower[y])] = 0
+        found = lower[y][positions] == zs
+        values = table[y]
+        ret[found, :values.shape[1]] = values[positions[found]]
+        return ret
+
+    start = time.time()
+    for w in range(1, n):
+        zs = lower[w]
+        width = int(lengths[w]) + 1
+        if inverse[w] < w:
+            # h_{y,w} = h_{y^-1,w^-1}, reordered to the sorted lower[w]
+            order = np.argsort(inverse[lower[inverse[w]]])
+            table[w] = table[inverse[w]][order]
+            continue
+
+        x = int(group.prefix[w])
+        s = int(group.last_generator[w])
+        right = int(right_descents[w])
+        left = int(left_descents[w])
+        h_w = np.zeros((len(zs), width), dtype=np.int64)
+
+        # Elements sharing all descents of w use the recursion
+        shares = (((right_descents[zs] & right) == right) &
+                  ((left_descents[zs] & left) == left))
+        z = zs[shares]
+        h_zs = get(x, right_mul[z, s], width)
+        h_z = get(x, z, width)
+        h_zs[:, :-1] += h_z[:, 1:]
+        h_x = table[x]
+        for y, row in zip(lower[x].tolist(), h_x):
+            if y != x and row.shape[0] > 1 and row[1] != 0 and (right_descents[y] >> s) & 1:
+                h_zs -= int(row[1]) * get(y, z, width)
+                h_zs %= p
+        h_w[shares] = h_zs % p
+
+        # The rest are v h_{z',w} for a longer z' = zt or tz. Take t to be
+        # the first right (else left) descent of w missing for z.
+        rest = np.flatnonzero(~shares)
+        missing = right & ~right_descents[zs[rest]]
+        use_right = missing != 0
+        missing = np.where(use_right, missing,
+                           left & ~left_descents[zs[rest]])
+        t = np.log2(missing & -missing).astype(np.int64)
+        targets = np.where(use_right, right_mul[zs[rest], t],
+                           left_mul[zs[rest], t])
+        target_positions = np.searchsorted(zs, targets)
+        rest_lengths = lengths[zs[rest]]
+        for length in range(int(lengths[w]) - 1, -1, -1):
+            layer = rest_lengths == length
+            h_w[rest[layer], 1:] = h_w[target_positions[layer], :-1]
+        table[w] = h_w
+
+        difftime = time.time() - start
+        if difftime > 5.0:
+            print('KL-polynomials mod {} generated '.format(p) + '{:2.2f}%'.format(
+                100 * (w + 1) / n))
+            start = time.time()
+    return table
@@ -1,100 +1,186 @@
-import sortedcontainers as sc
-import collections
+import numpy as np
+
+# Polynomials with at most this many terms, all with coefficients of at
+# most this size, are interned automatically.
+INTERN_TERMS = 2
+INTERN_COEFFICIENT = 2
+
+# Map (offset, coefficients) -> interned Laurent
+_interned = dict()
 
 
 class Laurent:
-    def __init__(self, coef):
-        a = [(key, value) for key, value in coef.items() if value != 0]
-        self.coef = sc.SortedDict(a)
+    """
+    An immutable Laurent polynomial, stored densely as the degree of its
+    lowest term ('offset') and the tuple of coefficients from that degree up
+    to the highest term. The first and last coefficients are non-zero; the
+    zero polynomial has no coefficients.
+
+    Small polynomials, and those passed to intern(), are interned, so equal
+    values are usually the same object.
+    """
+    __slots__ = ('offset', 'coefficients', '_hash')
+
+    def __new__(cls, coef):
+        """
+        :param coef: A map from degree to coefficient.
+        """
+        degrees = [key for key, value in coef.items() if value != 0]
+        if not degrees:
+            return _make(0, ())
+        offset = min(degrees)
+        coefficients = [0] * (max(degrees) - offset + 1)
+        for degree in degrees:
+            coefficients[degree - offset] = coef[degree]
+        return _make(offset, tuple(coefficients))
+
+    @staticmethod
+    def from_coefficients(offset, coefficients):
+        """Creates a Laurent polynomial sum_i coefficients[i] v^(offset + i),
+        trimming zero coefficients at either end."""
+        start = 0
+        end = len(coefficients)
+        while start < end and coefficients[start] == 0:
+            start += 1
+        while end > start and coefficients[end - 1] == 0:
+            end -= 1
+        if start == end:
+            return zero
+        return _make(offset + start, tuple(coefficients[start:end]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Laurent polynomials are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Laurent polynomials are immutable')
+
+    def __reduce__(self):
+        return Laurent.from_coefficients, (self.offset, self.coefficients)
 
-    def shift(self, s):
-        return Laurent({(key + s): value
-                        for key, value in self.coef.items()})
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash',
+                               hash((self.offset, self.coefficients)))
+        return self._hash
+
+    @property
+    def coef(self):
+        """The non-zero coefficients as a map from degree to coefficient"""
+        return dict(self.items())
 
     def copy(self):
-        return Laurent(self.coef.copy())
+        return self
 
     def __contains__(self, key):
-        return key in self.coef
+        return self[key] != 0
 
     def __getitem__(self, key):
-        return self.coef.get(key, 0)
+        index = key - self.offset
+        if 0 <= index < len(self.coefficients):
+            return self.coefficients[index]
+        return 0
 
     def __call__(self, v):
         sum = 0
-        for deg, coef in self.coef.items():
+        for deg, coef in self.items():
             sum += coef * (v ** deg)
         return sum
 
     def __iter__(self):
-        for key, value in self.coef.items():
-            yield (key, value)
+        return iter(self.items())
 
     def items(self):
-        return self.coef.items()
+        """Returns the list of (degree, coefficient) of the non-zero terms,
+        in increasing degree"""
+        return [(deg, value)
+                for deg, value in enumerate(self.coefficients, self.offset)
+                if value != 0]
 
     def __eq__(self, other):
-        return self.coef == other.coef
+        if self is other:
+            return True
+        if not isinstance(other, Laurent):
+            return NotImplemented
+        return (self.offset == other.offset and
+                self.coefficients == other.coefficients)
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
 
     def __add__(self, other):
-        c = collections.Counter()
-        for deg1, value1 in self.coef.items():
-            c[deg1] += value1
-        for deg2, value2 in other.coef.items():
-            c[deg2] += value2
-        return Laurent(c)
+        if not other.coefficients:
+            return self
+        if not self.coefficients:
+            return other
+        offset = min(self.offset, other.offset)
+        end = max(self.offset + len(self.coefficients),
+                  other.offset + len(other.coefficients))
+        ret = [0] * (end - offset)
+        start = self.offset - offset
+        ret[start:start + len(self.coefficients)] = self.coefficients
+        for index, value in enumerate(other.coefficients,
+                                      other.offset - offset):
+            ret[index] += value
+        return Laurent.from_coefficients(offset, ret)
 
     def __neg__(self):
-        d = dict()
-        for deg, value in self.coef.items():
-            d[deg] = -value
-        return Laurent(d)
+        return Laurent.from_coefficients(
+            self.offset, [-value for value in self.coefficients])
 
     def __sub__(self, other):
         return self + (-other)
 
     def __mul__(self, other):
         if isinstance(other, int):
-            d = dict()
-            for deg, value in self.coef.items():
-                d[deg] = value * other
-            return Laurent(d)
+            return Laurent.from_coefficients(
+                self.offset, [value * other for value in self.coefficients])
         else:
-            c = collections.Counter()
-            for deg1, value1 in self.coef.items():
-                for deg2, value2 in other.coef.items():
-                    c[deg1 + deg2] += value1 * value2
-            return Laurent(c)
+            # Convolution of the coefficient arrays
+            if not self.coefficients or not other.coefficients:
+                return zero
+            ret = [0] * (len(self.coefficients) + len(other.coefficients) - 1)
+            for i, value1 in enumerate(self.coefficients):
+                if value1 != 0:
+                    for j, value2 in enumerate(other.coefficients, i):
+                        ret[j] += value1 * value2
+            return Laurent.from_coefficients(self.offset + other.offset, ret)
 
     def is_zero(self):
         return self == zero
 
     def all_positive_degree(self):
-        for deg, value in self.coef.items():
-            if deg <= 0:
-                return False
-        return True
+        return not self.coefficients or self.offset > 0
 
     def involute(self):
-        d = dict()
-        for deg, value in self.coef.items():
-            d[-deg] = value
-        return Laurent(d)
+        if not self.coefficients:
+            return self
+        return Laurent.from_coefficients(
+            -(self.offset + len(self.coefficients) - 1),
+            self.coefficients[::-1])
 
     def top(self):
-        if len(self.coef) == 0:
+        if len(self.coefficients) == 0:
             return None
         else:
-            return self.coef.keys()[-1]
+            return self.offset + len(self.coefficients) - 1
 
     def bottom(self):
-        if len(self.coef) == 0:
+        if len(self.coefficients) == 0:
             return None
         else:
-            return self.coef.keys()[0]
+            return self.offset
 
     def shift(self, n):
-        return self * Laurent({n: 1})
+        if not self.coefficients:
+            return self
+        return Laurent.from_coefficients(self.offset + n, self.coefficients)
 
     def __str__(self):
         return str(self.coef)
@@ -103,5 +189,122 @@ class Laurent:
         return f'hecke.laurent.Laurent({self.coef})'
 
 
+class LaurentAccumulator:
+    """
+    A mutable Laurent polynomial, used to sum many terms and products in
+    place before creating a (immutable) Laurent from the result.
+    """
+    __slots__ = ('offset', 'coefficients')
+
+    def __init__(self, p=None):
+        if p is None or not p.coefficients:
+            self.offset = 0
+            self.coefficients = []
+        else:
+            self.offset = p.offset
+            self.coefficients = list(p.coefficients)
+
+    def _reserve(self, low, high):
+        """Makes room for the degrees low, ..., high - 1"""
+        if not self.coefficients:
+            self.offset = low
+            self.coefficients = [0] * (high - low)
+            return
+        if low < self.offset:
+            self.coefficients[:0] = [0] * (self.offset - low)
+            self.offset = low
+        end = self.offset + len(self.coefficients)
+        if high > end:
+            self.coefficients.extend([0] * (high - end))
+
+    def iadd(self, p):
+        """self += p"""
+        if p.coefficients:
+            self._reserve(p.offset, p.offset + len(p.coefficients))
+            coefficients = self.coefficients
+            for index, value in enumerate(p.coefficients, p.offset - self.offset):
+                coefficients[index] += value
+        return self
+
+    def iadd_mul(self, a, b):
+        """self += a * b, without creating the product"""
+        if a.coefficients and b.coefficients:
+            low = a.offset + b.offset
+            self._reserve(low, low + len(a.coefficients) + len(b.coefficients) - 1)
+            coefficients = self.coefficients
+            start = low - self.offset
+            for i, value1 in enumerate(a.coefficients, start):
+                if value1 != 0:
+                    for j, value2 in enumerate(b.coefficients, i):
+                        coefficients[j] += value1 * value2
+        return self
+
+    def bottom(self):
+        """The lowest degree with a non-zero coefficient, or None"""
+        for index, value in enumerate(self.coefficients):
+            if value != 0:
+                return self.offset + index
+        return None
+
+    def __getitem__(self, key):
+        index = key - self.offset
+        if 0 <= index < len(self.coefficients):
+            return self.coefficients[index]
+        return 0
+
+    def laurent(self):
+        return Laurent.from_coefficients(self.offset, self.coefficients)
+
+
+def _make(offset, coefficients):
+    """Creates a Laurent polynomial from already trimmed coefficients"""
+    key = (offset, coefficients)
+    ret = _interned.get(key)
+    if ret is not None:
+        return ret
+    ret = object.__new__(Laurent)
+    object.__setattr__(ret, 'offset', offset)
+    object.__setattr__(ret, 'coefficients', coefficients)
+    object.__setattr__(ret, '_hash', None)
+    if len(coefficients) <= INTERN_TERMS and all(
+            -INTERN_COEFFICIENT <= value <= INTERN_COEFFICIENT
+            for value in coefficients):
+        _interned[key] = ret
+    return ret
+
+
+def intern(p):
+    """Returns the interned copy of p, interning p if there is none"""
+    return _interned.setdefault((p.offset, p.coefficients), p)
+
+
 zero = Laurent({})
 one = Laurent({0: 1})
+v = Laurent({1: 1})
+v_inverse = Laurent({-1: 1})
+# Frequently occurring polynomials
+v_plus_v_inverse = intern(Laurent({-1: 1, 1: 1}))
+v_minus_v_inverse = intern(Laurent({-1: -1, 1: 1}))
+v_inverse_minus_v = intern(Laurent({-1: 1, 1: -1}))
+
+
+def pack(polynomials):
+    """
+    Packs a list of Laurent polynomials into three numpy arrays: the lowest
+    degree of each polynomial, the start of the coefficients of each
+    polynomial (with one more entry for the end of the last), and all
+    coefficients concatenated.
+    """
+    offsets = np.array([p.offset for p in polynomials], dtype=np.int64)
+    pointers = np.zeros(len(polynomials) + 1, dtype=np.int64)
+    pointers[1:] = np.cumsum([len(p.coefficients) for p in polynomials])
+    coefficients = np.array([value for p in polynomials for value in p.coefficients],
+                            dtype=np.int64)
+    return offsets, pointers, coefficients
+
+
+def unpack(offsets, pointers, coefficients, i):
+    """Returns the i-th polynomial packed by pack(), given the arrays
+    returned by it converted to lists"""
+    # The packed coefficients are already trimmed
+    return _make(offsets[i], tuple(coefficients[pointers[i]:pointers[i + 1]]))
@@ -0,0 +1,216 @@
+import jk.hecke.laurent as l
+import numpy as np
+import os
+
+"""
+Sparse matrices with Laurent polynomial entries, indexed by pairs of group
+element indices. They are stored by column, as maps from row to non-zero
+Laurent polynomial, which is the access pattern of a change of basis: column
+x holds the coordinates of the image of H_x.
+
+Lists of such columns (also the tables of KL polynomials) can be saved as
+.npy files, with each distinct polynomial stored once, and loaded memory
+mapped, unpacking a column when it is first used.
+"""
+
+# The arrays written by save_columns: the start of each column in the
+# entries, the rows of the entries, the number of the polynomial of each
+# entry, and the distinct polynomials packed by laurent.pack()
+_COLUMN_ARRAYS = ['offsets', 'rows', 'ids', 'degrees', 'pointers',
+                  'coefficients']
+
+
+class PolynomialMatrix:
+    def __init__(self, columns):
+        """
+        :param columns: A list, indexed by column, of maps from row to
+            non-zero Laurent polynomial.
+        """
+        self.columns = columns
+
+    @staticmethod
+    def from_basis(basis):
+        """
+        Returns the matrix with column x the coefficients of the basis
+        element b_x in the standard basis.
+        """
+        return PolynomialMatrix([{} if element is None else dict(element.terms)
+                                 for element in basis.elements])
+
+    def __getitem__(self, key):
+        row, column = key
+        return self.columns[column].get(row, l.zero)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __eq__(self, other):
+        return self.columns == other.columns
+
+    def transpose(self):
+        columns = [dict() for _ in self.columns]
+        for x, column in enumerate(self.columns):
+            for y, entry in column.items():
+                columns[y][x] = entry
+        return PolynomialMatrix(columns)
+
+    def nonzero(self):
+        """The number of non-zero entries"""
+        return sum(len(column) for column in self.columns)
+
+    def apply(self, terms):
+        """
+        Returns the product of the matrix with the vector 'terms', a map from
+        column to Laurent polynomial, as a map from row to non-zero Laurent
+        polynomial.
+        """
+        accumulators = dict()
+        for x, coeff in terms.items():
+            for y, entry in self.columns[x].items():
+                accumulator = accumulators.get(y)
+                if accumulator is None:
+                    accumulator = accumulators[y] = l.LaurentAccumulator()
+                accumulator.iadd_mul(entry, coeff)
+        ret = dict()
+        for y, accumulator in accumulators.items():
+            coeff = accumulator.laurent()
+            if coeff != l.zero:
+                ret[y] = coeff
+        return ret
+
+    def inverse_unitriangular(self, order):
+        """
+        Returns the inverse of the matrix, which has to be unitriangular with
+        respect to 'order': every column x is the unit vector e_x plus
+        entries in rows after x in the list 'order'. Columns not in 'order'
+        are left empty.
+        """
+        columns = [{} for _ in self.columns]
+        # If b_x = H_x + sum_y B[y, x] H_y, then
+        # H_x = b_x - sum_y B[y, x] H_y, with H_y known for y after x.
+        for x in reversed(order):
+            accumulators = dict()
+            for y, entry in self.columns[x].items():
+                if y == x:
+                    continue
+                for z, inverse_entry in columns[y].items():
+                    accumulator = accumulators.get(z)
+                    if accumulator is None:
+                        accumulator = accumulators[z] = l.LaurentAccumulator()
+                    accumulator.iadd_mul(entry, inverse_entry)
+            column = {x: l.one}
+            for z, accumulator in accumulators.items():
+                coeff = -accumulator.laurent()
+                if coeff != l.zero:
+                    column[z] = coeff
+            columns[x] = column
+        return PolynomialMatrix(columns)
+
+
+def _column_path(directory, name, array):
+    return os.path.join(directory, f'{name}_{array}.npy')
+
+
+def pack_columns(columns):
+    """
+    Packs the list 'columns' of maps from row to Laurent polynomial into the
+    arrays (offsets, rows, ids, degrees, pointers, coefficients) described
+    at _COLUMN_ARRAYS.
+    """
+    polynomials = dict()
+    offsets = [0]
+    rows = []
+    ids = []
+    for column in columns:
+        for row, p in column.items():
+            rows.append(row)
+            ids.append(polynomials.setdefault(p, len(polynomials)))
+        offsets.append(len(rows))
+    return [np.array(offsets, dtype=np.int64), np.array(rows, dtype=np.int32),
+            np.array(ids, dtype=np.int32)] + list(l.pack(list(polynomials)))
+
+
+def merge_packed(parts):
+    """
+    Returns the arrays of pack_columns for the concatenation of the lists of
+    columns packed in 'parts', keeping each distinct polynomial once.
+    """
+    polynomials = dict()
+    offsets = [np.zeros(1, dtype=np.int64)]
+    rows = []
+    ids = []
+    total = 0
+    for part_offsets, part_rows, part_ids, degrees, pointers, coefficients in parts:
+        packed = (degrees.tolist(), pointers.tolist(), coefficients.tolist())
+        numbers = np.array([polynomials.setdefault(l.unpack(*packed, i), len(polynomials))
+                            for i in range(len(packed[0]))], dtype=np.int32)
+        offsets.append(part_offsets[1:] + total)
+        total += int(part_offsets[-1])
+        rows.append(part_rows)
+        ids.append(numbers[part_ids])
+    return [np.concatenate(offsets), np.concatenate(rows).astype(np.int32),
+            np.concatenate(ids).astype(np.int32)] + list(l.pack(list(polynomials)))
+
+
+def save_packed(directory, name, arrays):
+    """Saves the arrays of pack_columns as the files '<name>_<array>.npy'
+    in 'directory'"""
+    for array_name, array in zip(_COLUMN_ARRAYS, arrays):
+        np.save(_column_path(directory, name, array_name), array)
+
+
+def save_columns(directory, name, columns):
+    """
+    Saves the list 'columns' of maps from row to Laurent polynomial as the
+    files '<name>_<array>.npy' in 'directory'.
+    """
+    save_packed(directory, name, pack_columns(columns))
+
+
+def columns_saved(directory, name):
+    """Returns True if save_columns has saved columns 'name' in 'directory'"""
+    return all(os.path.exists(_column_path(directory, name, array))
+               for array in _COLUMN_ARRAYS)
+
+
+class PackedColumns:
+    """
+    The read-only list of columns saved by save_columns. The rows and
+    polynomial numbers are memory mapped, and each column is unpacked into a
+    map from row to Laurent polynomial when it is first accessed.
+    """
+    def __init__(self, directory, name):
+        arrays = {array: np.load(_column_path(directory, name, array),
+                                 mmap_mode='r')
+                  for array in _COLUMN_ARRAYS}
+        self.offsets = arrays['offsets'].tolist()
+        self.rows = arrays['rows']
+        self.ids = arrays['ids']
+        packed = [arrays[array].tolist()
+                  for array in ('degrees', 'pointers', 'coefficients')]
+        self.polynomials = [l.unpack(*packed, i) for i in range(len(packed[0]))]
+        self._columns = [None] * (len(self.offsets) - 1)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __getitem__(self, x):
+        ret = self._columns[x]
+        if ret is None:
+            ret = self._columns[x] = self.column(x)
+        return ret
+
+    def column(self, x):
+        """Unpacks column x without keeping it"""
+        start, end = self.offsets[x], self.offsets[x + 1]
+        polynomials = self.polynomials
+        return dict(zip(self.rows[start:end].tolist(),
+                        [polynomials[i] for i in self.ids[start:end].tolist()]))
+
+    def __iter__(self):
+        for x in range(len(self._columns)):
+            yield self[x]
+
+    def is_unpacked(self, x):
+        """Returns True if column x has been unpacked"""
+        return self._columns[x] is not None
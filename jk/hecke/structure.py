@@ -0,0 +1,152 @@
+import jk.hecke.laurent as l
+import numpy as np
+import time
+
+"""
+Structure constants of the Kazhdan-Lusztig basis,
+    C_x C_y = sum_z h_{x,y,z} C_z,
+for x in a subset of the group and all y. For a simple reflection s
+    C_s C_y = (v + v^-1) C_y                               if sy < y,
+    C_s C_y = C_sy + sum_{z < y, sz < z} mu(z,y) C_z       if sy > y,
+and the other products are decomposed into the KL basis.
+"""
+
+
+class KLStructureConstants:
+    """
+    The structure constants, stored like a CSR matrix with one row per pair
+    (xs[i], y): the entries of the row are
+    row_offsets[i * n + y] : row_offsets[i * n + y + 1], with columns z in
+    'columns' and the polynomials h_{x,y,z} packed by laurent.pack() into
+    'degrees', 'pointers' and 'coefficients'.
+    """
+    def __init__(self, xs, n, row_offsets, columns, degrees, pointers,
+                 coefficients):
+        self.xs = [int(x) for x in xs]
+        self.n = int(n)
+        self.row_offsets = row_offsets
+        self.columns = columns
+        self.degrees = degrees
+        self.pointers = pointers
+        self.coefficients = coefficients
+        self._positions = {x: i for i, x in enumerate(self.xs)}
+        # Lists for fast lookups, and the unpacked polynomials
+        self._row_offsets = row_offsets.tolist()
+        self._columns = columns.tolist()
+        self._packed = (degrees.tolist(), pointers.tolist(),
+                        coefficients.tolist())
+        self._polynomials = [None] * len(self._columns)
+
+    @staticmethod
+    def compute(hecke, xs=None):
+        """
+        :param hecke: The HeckeAlgebra.
+        :param xs: The element names or indices x, all elements if None.
+        """
+        group = hecke.group
+        n = len(group.names)
+        if xs is None:
+            xs = range(n)
+        xs = sorted({hecke.group.index(x) for x in xs})
+        kl_basis = hecke.generate_kl_basis()
+        table = hecke.kl_polynomials().table
+        lengths = group.lengths.tolist()
+        left_mul = group.left_mul.tolist()
+        left_descents = group.left_descents.tolist()
+
+        row_offsets = [0]
+        columns = []
+        polynomials = []
+        start = time.time()
+        for i, x in enumerate(xs):
+            s = int(group.last_generator[x])
+            for y in range(n):
+                if x == 0:
+                    row = {y: l.one}
+                elif lengths[x] == 1 and (left_descents[y] >> s) & 1:
+                    row = {y: l.v_plus_v_inverse}
+                elif lengths[x] == 1:
+                    row = {left_mul[y][s]: l.one}
+                    for z, p in table[y].items():
+                        if z != y and p[1] != 0 and (left_descents[z] >> s) & 1:
+                            row[z] = l.Laurent.from_coefficients(0, [p[1]])
+                else:
+                    row = kl_basis.decompose(kl_basis[x] * kl_basis[y])
+                for z in sorted(row):
+                    columns.append(z)
+                    polynomials.append(row[z])
+                row_offsets.append(len(columns))
+
+            difftime = time.time() - start
+            if difftime > 5.0:
+                print('Structure constants generated ' + '{:2.2f}%'.format(
+                    100 * (i + 1) / len(xs)))
+                start = time.time()
+
+        degrees, pointers, coefficients = l.pack(polynomials)
+        return KLStructureConstants(
+            xs, n, np.array(row_offsets, dtype=np.int64),
+            np.array(columns, dtype=np.int32), degrees, pointers, coefficients)
+
+    def _polynomial(self, entry):
+        ret = self._polynomials[entry]
+        if ret is None:
+            ret = self._polynomials[entry] = l.unpack(*self._packed, entry)
+        return ret
+
+    def _row(self, x, y):
+        position = self._positions.get(x)
+        if position is None:
+            raise KeyError(f'No structure constants for x = {x}')
+        row = position * self.n + y
+        return range(self._row_offsets[row], self._row_offsets[row + 1])
+
+    def __getitem__(self, key):
+        """Returns the map z -> h_{x,y,z} for the element indices (x, y)"""
+        x, y = key
+        return {self._columns[entry]: self._polynomial(entry)
+                for entry in self._row(x, y)}
+
+    def h(self, x, y, z):
+        for entry in self._row(x, y):
+            if self._columns[entry] == z:
+                return self._polynomial(entry)
+        return l.zero
+
+    def multiply(self, a, b):
+        """
+        Returns the product of a and b, given in the KL basis as maps from
+        element index to Laurent polynomial, in the KL basis. The support of
+        a has to be in xs.
+        """
+        accumulators = dict()
+        for x, a_coeff in a.items():
+            for y, b_coeff in b.items():
+                coeff = a_coeff * b_coeff
+                for entry in self._row(x, y):
+                    z = self._columns[entry]
+                    accumulator = accumulators.get(z)
+                    if accumulator is None:
+                        accumulator = accumulators[z] = l.LaurentAccumulator()
+                    accumulator.iadd_mul(self._polynomial(entry), coeff)
+        ret = dict()
+        for z, accumulator in accumulators.items():
+            coeff = accumulator.laurent()
+            if coeff != l.zero:
+                ret[z] = coeff
+        return ret
+
+    def save(self, file):
+        """Saves the structure constants with numpy.savez"""
+        np.savez(file, xs=np.array(self.xs, dtype=np.int64), n=self.n,
+                 row_offsets=self.row_offsets, columns=self.columns,
+                 degrees=self.degrees, pointers=self.pointers,
+                 coefficients=self.coefficients)
+
+    @staticmethod
+    def load(file):
+        """Loads structure constants saved by save()"""
+        with np.load(file) as data:
+            return KLStructureConstants(
+                data['xs'], data['n'], data['row_offsets'], data['columns'],
+                data['degrees'], data['pointers'], data['coefficients'])
@@ -0,0 +1,114 @@
+import multiprocessing
+import numpy as np
+
+"""
+The W-graph of the Kazhdan-Lusztig basis: the vertices are the group
+elements, labelled by their descent sets, and x and y are joined by an edge
+of weight mu(x,y) (or mu(y,x)), the coefficient of v in h_{x,y}, whenever it
+is non-zero. For s not in R(x)
+    C_x C_s = sum_{y : s in R(y)} mu~(x,y) C_y,
+where mu~ is the edge weight and mu~(x,xs) = 1. If s is in R(x) then
+C_x C_s = (v + v^-1) C_x.
+
+The edges can be read off the KL table by a pool of forked worker
+processes, which share the table of the parent process read-only.
+"""
+
+# The KL table shared with forked worker processes
+_shared_table = None
+
+
+class WGraph:
+    def __init__(self, group, kl_polynomials, workers=None):
+        """
+        :param group: The CoxeterGroup.
+        :param kl_polynomials: The KLPolynomials of the group.
+        :param workers: The number of processes extracting the edges. This
+            needs the 'fork' start method, else the edges are extracted in
+            this process.
+        """
+        self.group = group
+        n = len(group.names)
+        self.right_descents = group.right_descents
+        self.left_descents = group.left_descents
+
+        table = kl_polynomials.table
+        if (workers is not None and workers > 1 and
+                'fork' in multiprocessing.get_all_start_methods()):
+            global _shared_table
+            _shared_table = table
+            size = max(1, n // (4 * workers))
+            chunks = [(start, min(start + size, n)) for start in range(0, n, size)]
+            try:
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    # map keeps the order of the chunks
+                    edges = pool.map(_chunk_edges, chunks)
+            finally:
+                _shared_table = None
+        else:
+            edges = [_edges(table, 0, n)]
+        sources = np.concatenate([chunk[0] for chunk in edges])
+        targets = np.concatenate([chunk[1] for chunk in edges])
+        weights = np.concatenate([chunk[2] for chunk in edges])
+        order = np.lexsort((targets, sources))
+        # The edges at x are targets[offsets[x]:offsets[x + 1]], with
+        # weights[offsets[x]:offsets[x + 1]]
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(sources, minlength=n))
+        self.targets = targets[order]
+        self.weights = weights[order]
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._weights = self.weights.tolist()
+
+    def neighbours(self, x):
+        """Returns the list of (y, mu~(x,y)) over the edges at x"""
+        start, end = self._offsets[x], self._offsets[x + 1]
+        return list(zip(self._targets[start:end], self._weights[start:end]))
+
+    def mu(self, x, y):
+        """The edge weight mu~(x,y), 0 if there is no edge"""
+        start, end = self._offsets[x], self._offsets[x + 1]
+        position = start + int(np.searchsorted(self.targets[start:end], y))
+        if position < end and self._targets[position] == y:
+            return self._weights[position]
+        return 0
+
+    def right_digraph(self):
+        """
+        Returns the map x -> set of y such that C_y occurs in C_x C_s for some
+        simple reflection s: x itself if R(x) is not empty, and the
+        neighbours y with R(y) not contained in R(x).
+        """
+        descents = self.right_descents.tolist()
+        ret = dict()
+        for x in range(len(descents)):
+            start, end = self._offsets[x], self._offsets[x + 1]
+            d = {x} if descents[x] else set()
+            d.update(y for y in self._targets[start:end]
+                     if descents[y] & ~descents[x])
+            ret[x] = d
+        return ret
+
+
+def _edges(table, start, end):
+    """
+    Returns the arrays (sources, targets, weights) of the edges in both
+    directions between w and y < w with mu(y,w) != 0, for start <= w < end.
+    """
+    sources = []
+    targets = []
+    weights = []
+    for w in range(start, end):
+        for y, p in table[w].items():
+            if y != w and p[1] != 0:
+                sources.extend((y, w))
+                targets.extend((w, y))
+                weights.extend((p[1], p[1]))
+    return (np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            np.array(weights, dtype=np.int64))
+
+
+def _chunk_edges(chunk):
+    """_edges in a forked worker, on the table shared by the parent"""
+    return _edges(_shared_table, *chunk)
@@ -0,0 +1,54 @@
+import unittest
+
+from jk.hecke import coxeter as c
+
+
+def subword_order(group):
+    """x <= w if x is a subword of the reduced word of w"""
+    below = dict()
+    for w in range(len(group.names)):
+        reachable = {0}
+        for s in group.word(w):
+            reachable |= {int(group.right_mul[x, s]) for x in reachable}
+        below[w] = reachable
+    return below
+
+
+class TestBruhat(unittest.TestCase):
+    def test_a2(self):
+        group = c.generate_a2()
+
+        self.assertTrue(group.bruhat_le('e', 'rsr'))
+        self.assertTrue(group.bruhat_le('r', 'sr'))
+        self.assertTrue(group.bruhat_le('s', 'sr'))
+        self.assertFalse(group.bruhat_le('rs', 'sr'))
+        self.assertFalse(group.bruhat_le('rsr', 'r'))
+        self.assertEqual([x.name for x in group.bruhat_interval('r', 'rsr')],
+                         ['r', 'rs', 'sr', 'rsr'])
+        self.assertEqual([x.name for x in group.bruhat_interval('rs', 'sr')],
+                         [])
+
+    def test_subword_property(self):
+        for group in [c.generate_a3(), c.generate_b3(), c.generate_d4()]:
+            order = group.bruhat_order()
+            below = subword_order(group)
+            n = len(group.names)
+            for w in range(n):
+                self.assertEqual(set(order.lower(w).tolist()), below[w])
+                for y in range(n):
+                    self.assertEqual(order.le(y, w), y in below[w])
+                    if y in below[w]:
+                        self.assertEqual(
+                            list(order.interval(y, w)),
+                            [x for x in sorted(below[w])
+                             if y in below[x]])
+
+    def test_tableau_criterion(self):
+        for group in [c.generate_a4(), c.generate_b3(), c.generate_d4()]:
+            order = group.bruhat_order()
+            n = len(group.names)
+            for x in range(n):
+                for y in range(n):
+                    self.assertEqual(order.tableau_le(x, y), order.le(x, y))
+
+        self.assertEqual(c.generate_d4().bruhat_order().criterion, 'D')
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from jk.hecke import cache, coxeter as c, hecke as h, matrix as m
+
+
+class TestCache(unittest.TestCase):
+    def test_group(self):
+        group = c.generate_b3()
+        group.bruhat_order()
+        with tempfile.TemporaryDirectory() as directory:
+            group.save(directory)
+            loaded = c.CoxeterGroup.load(directory)
+            self.assertEqual(loaded.names, group.names)
+            self.assertEqual(loaded.generator_names, group.generator_names)
+            self.assertTrue((loaded.right_mul == group.right_mul).all())
+            self.assertTrue((loaded.left_mul == group.left_mul).all())
+            self.assertTrue((loaded.right_descents == group.right_descents).all())
+            self.assertEqual(loaded['rsts'].inverse().name, group['rsts'].inverse().name)
+            self.assertEqual((loaded['rs'] * loaded['t']).name, 'rst')
+            self.assertTrue(loaded.bruhat_le('r', 'srs'))
+            self.assertFalse(loaded.bruhat_le('t', 'srs'))
+
+    def test_columns(self):
+        group = c.generate_a3()
+        table = h.HeckeAlgebra(group).kl_polynomials().table
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertFalse(m.columns_saved(directory, 'kl'))
+            m.save_columns(directory, 'kl', table)
+            self.assertTrue(m.columns_saved(directory, 'kl'))
+            columns = m.PackedColumns(directory, 'kl')
+            self.assertEqual(len(columns), len(table))
+            self.assertEqual(list(columns), table)
+            # Each distinct polynomial is stored once
+            self.assertEqual(len(columns.polynomials),
+                             len({p for column in table for p in column.values()}))
+
+            merged = m.merge_packed([m.pack_columns(table[:5]),
+                                     m.pack_columns(table[5:])])
+            m.save_packed(directory, 'merged', merged)
+            self.assertEqual(list(m.PackedColumns(directory, 'merged')), table)
+            self.assertEqual(len(merged[3]), len(columns.polynomials))
+
+    def test_cached_hecke(self):
+        generators = c.generate_a3().generators
+        hecke = h.HeckeAlgebra(c.CoxeterGroup.generate(generators))
+        kl_basis = hecke.generate_kl_basis()
+        dual_kl_basis = hecke.generate_dual_kl_basis()
+        left_order, right_order = hecke.generate_orders()
+        with tempfile.TemporaryDirectory() as root:
+            computed = cache.cached_hecke(generators, root)
+            entry = os.path.join(root, cache.key(generators))
+            self.assertTrue(os.path.isdir(entry))
+
+            loaded = cache.cached_hecke(generators, root)
+            self.assertIsInstance(loaded.kl_polynomials().table, m.PackedColumns)
+            self.assertTrue((loaded.left_order() == left_order).all())
+            self.assertTrue((loaded.right_order() == right_order).all())
+            for x in loaded.group.all_elements():
+                self.assertEqual(loaded.generate_kl_basis()[x.index].terms,
+                                 kl_basis[x.index].terms)
+                self.assertEqual(loaded.generate_dual_kl_basis()[x.index].terms,
+                                 dual_kl_basis[x.index].terms)
+                self.assertEqual(
+                    loaded.generate_kl_basis()[x.index].dual_kl_filtration(),
+                    computed.generate_kl_basis()[x.index].dual_kl_filtration())
+
+            # Loading and creating the bases unpacks no columns
+            loaded = cache.cached_hecke(generators, root)
+            table = loaded.kl_polynomials().table
+            dual_columns = loaded.generate_dual_kl_basis().elements.table
+            loaded_kl_basis = loaded.generate_kl_basis()
+            n = len(loaded.group.names)
+            self.assertFalse(any(table.is_unpacked(x) for x in range(n)))
+            self.assertFalse(any(dual_columns.is_unpacked(x) for x in range(n)))
+            rs = loaded.group['rs'].index
+            self.assertEqual(loaded_kl_basis[rs].terms, kl_basis[rs].terms)
+            self.assertEqual([x for x in range(n) if table.is_unpacked(x)], [rs])
+
+            # The group is read from the same entry
+            self.assertEqual(cache.cached_group(generators, root).names,
+                             hecke.group.names)
+
+    def test_version(self):
+        generators = c.generate_a2().generators
+        with tempfile.TemporaryDirectory() as root:
+            cache.cached_group(generators, root)
+            info = os.path.join(root, cache.key(generators), 'format.json')
+            with open(info) as f:
+                data = json.load(f)
+            self.assertEqual(data['version'], cache.FORMAT_VERSION)
+            self.assertEqual(data['contents'], ['group'])
+
+            # Outdated and partial entries are regenerated
+            data['version'] = cache.FORMAT_VERSION - 1
+            with open(info, 'w') as f:
+                json.dump(data, f)
+            hecke = cache.cached_hecke(generators, root)
+            with open(info) as f:
+                data = json.load(f)
+            self.assertEqual(data['version'], cache.FORMAT_VERSION)
+            self.assertEqual(data['contents'], ['group', 'hecke'])
+            self.assertEqual(len(os.listdir(root)), 1)
+            self.assertTrue(np.array_equal(
+                cache.cached_hecke(generators, root).right_order(), hecke.right_order()))
+
+    def test_store_keeps_valid_entry(self):
+        generators = c.generate_a2().generators
+        with tempfile.TemporaryDirectory() as root:
+            cache.cached_hecke(generators, root)
+            entry = os.path.join(root, cache.key(generators))
+            info = os.stat(os.path.join(entry, 'format.json'))
+
+            # Another process finishing later does not replace the entry
+            cache._store(generators, root, 'group', c.generate_a2().save)
+            self.assertEqual(os.stat(os.path.join(entry, 'format.json')).st_ino,
+                             info.st_ino)
+            self.assertIsNotNone(cache._entry(generators, root, 'hecke'))
+            self.assertEqual(os.listdir(root), [cache.key(generators)])
+
+    def test_key(self):
+        self.assertEqual(cache.key(c.generate_b3().generators),
+                         cache.key(c.generate_b3().generators))
+        self.assertNotEqual(cache.key(c.generate_b3().generators),
+                            cache.key(c.generate_a3().generators))
@@ -0,0 +1,41 @@
+import unittest
+
+from jk.hecke import coxeter as c, hecke as h
+
+
+class TestCells(unittest.TestCase):
+    def test_cells_from_orders(self):
+        for group in [c.generate_a3(), c.generate_b3()]:
+            hecke = h.HeckeAlgebra(group)
+            left_order, right_order = hecke.generate_orders()
+            for cells, order in [(hecke.left_cells(), left_order),
+                                 (hecke.right_cells(), right_order)]:
+                for x in range(len(group.names)):
+                    for y in range(len(group.names)):
+                        self.assertEqual(cells.same_cell(x, y),
+                                         bool(order[x, y] and order[y, x]))
+                        self.assertEqual(cells.le(x, y), bool(order[x, y]))
+
+    def test_a3(self):
+        group = c.generate_a3()
+        hecke = h.HeckeAlgebra(group)
+        left_cells = hecke.left_cells()
+        self.assertEqual(len(left_cells), 10)
+        self.assertEqual([group.names[x] for x in left_cells.cell('rt')],
+                         ['rt', 'srt'])
+        self.assertEqual(left_cells.label('e'), len(left_cells) - 1)
+        self.assertEqual(left_cells.label(group.longest.index), 0)
+        self.assertEqual(len(hecke.right_cells()), 10)
+
+        # The two-sided cells of A3 correspond to the partitions of 4
+        two_sided_cells = hecke.two_sided_cells()
+        self.assertEqual(sorted(len(cell) for cell in two_sided_cells.cells()),
+                         [1, 1, 4, 9, 9])
+        self.assertTrue(two_sided_cells.same_cell('rt', 'srts'))
+        self.assertTrue(two_sided_cells.same_cell('r', 'rst'))
+        self.assertTrue(two_sided_cells.le('rsr', 'r'))
+        self.assertFalse(two_sided_cells.le('r', 'rsr'))
+        for x in group.all_elements():
+            for y in group.all_elements():
+                if left_cells.same_cell(x.index, y.index):
+                    self.assertTrue(two_sided_cells.same_cell(x.index, y.index))
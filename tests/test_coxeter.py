@@ -11,6 +11,19 @@ class TestCoxeter(unittest.TestCase):
                               'b': p.Permutation([2, 1])
                           })
 
+    def testGenerateFailsOnNonSignedPermutations(self):
+        with self.assertRaises(Exception):
+            c.CoxeterGroup.generate({'r': p.Permutation([1, 1]),
+                                     's': p.Permutation([1, -2])})
+        with self.assertRaises(Exception):
+            c.CoxeterGroup.generate({'r': p.Permutation([2, 3, 1])})
+
+    def test_g2(self):
+        group = c.generate_g2()
+        self.assertEqual(len(group.names), 12)
+        self.assertEqual(group.longest.name, 'rsrsrs')
+        self.assertEqual(group.longest.length(), 6)
+
     def testGenerateReturnsIdentity(self):
         group = c.generate_a1()
 
@@ -113,4 +126,47 @@ class TestCoxeter(unittest.TestCase):
         names = [x.name for x in group.all_elements()]
         expected_names = ['e', 'r', 's', 'rs', 'sr', 'rsr', 'srs', 'rsrs']
 
-        self.assertEqual(names, expected_names)
\ No newline at end of file
+        self.assertEqual(names, expected_names)
+
+    def test_multiplication_tables(self):
+        group = c.generate_b3()
+
+        for x in group.all_elements():
+            for position, s in enumerate(group.all_generators()):
+                xs = group.name_lookup[x.permutation() * s.permutation()]
+                sx = group.name_lookup[s.permutation() * x.permutation()]
+                self.assertEqual(group.right_mul[x.index, position],
+                                 group[xs].index)
+                self.assertEqual(group.left_mul[x.index, position],
+                                 group[sx].index)
+
+    def test_product_table(self):
+        group = c.generate_a3()
+        table = group.product_table()
+
+        for x in group.all_elements():
+            for y in group.all_elements():
+                xy = group.name_lookup[x.permutation() * y.permutation()]
+                self.assertEqual(table[x.index, y.index], group[xy].index)
+
+    def test_generated_order(self):
+        group = c.generate_d4()
+
+        names = [x.name for x in group.all_elements()]
+        self.assertEqual(names[1:], sorted(names[1:], key=lambda x: (len(x), x)))
+        self.assertEqual(len(names), 192)
+        for x in group.all_elements():
+            self.assertEqual(list(group.permutation_array[x.index]),
+                             x.permutation().values)
+            self.assertEqual(group.inverse_index[x.index], x.inverse().index)
+
+    def test_descents(self):
+        group = c.generate_b3()
+
+        for x in group.all_elements():
+            self.assertEqual(x.length(), 0 if x.name == 'e' else len(x.name))
+            for position, s in enumerate(group.all_generators()):
+                self.assertEqual(group.is_right_descent(x.index, position),
+                                 (x * s).length() < x.length())
+                self.assertEqual(group.is_left_descent(x.index, position),
+                                 (s * x).length() < x.length())
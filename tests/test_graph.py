@@ -0,0 +1,60 @@
+import random
+import unittest
+
+import numpy as np
+
+from jk.hecke import graph as gr
+
+
+class TestGraph(unittest.TestCase):
+    def test_components(self):
+        successors = [{1}, {2}, {0, 3}, {4}, {3}, {4}]
+        labels, components = gr.strongly_connected_components(successors)
+        self.assertEqual(sorted(sorted(c) for c in components),
+                         [[0, 1, 2], [3, 4], [5]])
+        # Reverse topological order
+        self.assertLess(labels[3], labels[0])
+        self.assertLess(labels[4], labels[5])
+        self.assertEqual(gr.condensation(successors, labels, len(components))[labels[0]],
+                         {labels[3]})
+
+    def test_long_path(self):
+        # Deeper than the recursion limit
+        n = 100000
+        successors = [[x + 1] for x in range(n - 1)] + [[0]]
+        labels, components = gr.strongly_connected_components(successors)
+        self.assertEqual(len(components), 1)
+        successors[-1] = []
+        labels, components = gr.strongly_connected_components(successors)
+        self.assertEqual(len(components), n)
+        # Successors come first
+        self.assertEqual(labels[:3], [n - 1, n - 2, n - 3])
+
+        # The reach of a path has about n^2 / 2 bits, so check a short one
+        n = 100
+        labels, _, reach = gr.reachability([[x + 1] for x in range(n - 1)] + [[]])
+        self.assertEqual(reach[labels[0]], (1 << n) - 1)
+        self.assertEqual(reach[labels[n - 1]], 1 << (n - 1))
+
+    def test_transitive_closure(self):
+        random.seed(1)
+        n = 61
+        successors = [set(random.sample(range(n), 2)) for _ in range(n)]
+        expected = np.zeros((n, n), dtype=bool)
+        for x in range(n):
+            seen = {x}
+            todo = [x]
+            while todo:
+                for y in successors[todo.pop()]:
+                    if y not in seen:
+                        seen.add(y)
+                        todo.append(y)
+            expected[list(seen), x] = True
+        self.assertTrue(np.array_equal(gr.transitive_closure(successors), expected))
+
+    def test_bitsets(self):
+        matrix = gr.bitsets_to_matrix([0b1011, 1 << 10, 0], 11)
+        self.assertEqual(matrix.shape, (3, 11))
+        self.assertEqual(np.flatnonzero(matrix[0]).tolist(), [0, 1, 3])
+        self.assertEqual(np.flatnonzero(matrix[1]).tolist(), [10])
+        self.assertFalse(matrix[2].any())
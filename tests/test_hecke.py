@@ -1,5 +1,5 @@
 import unittest
-from jk.hecke import hecke as h, coxeter as c
+from jk.hecke import hecke as h, coxeter as c, matrix as m
 import jk.hecke.laurent as l
 import numpy as np
 
@@ -464,4 +464,264 @@ class TestHecke(unittest.TestCase):
         ], dtype=bool)
 
         np.testing.assert_array_equal(right, expected_right)
-        # np.testing.assert_array_equal(left, expected_left)
+        np.testing.assert_array_equal(left, expected_left)
+        self.assertEqual(left.dtype, bool)
+
+    def test_left_order(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        right = hecke.right_order()
+        # The left order is only computed when asked for
+        self.assertIsNone(hecke._left_order)
+        left = hecke.left_order()
+        for x in group.all_elements():
+            for y in group.all_elements():
+                self.assertEqual(left[x.index, y.index],
+                                 right[x.inverse().index, y.inverse().index])
+
+    def test_index_keys(self):
+        group = c.generate_a2()
+        hecke = h.HeckeAlgebra(group)
+
+        by_name = hecke.element({
+            'e': l.Laurent({1: 2}),
+            'rs': l.Laurent({0: 1})
+        })
+        by_index = hecke.element({
+            group['e'].index: l.Laurent({1: 2}),
+            group['rs'].index: l.Laurent({0: 1})
+        })
+
+        self.assertEqual(by_name, by_index)
+        self.assertEqual(by_index.elements, by_name.elements)
+        self.assertEqual(by_index['rs'], l.one)
+
+        kl_basis = hecke.generate_kl_basis()
+        for x in group.all_elements():
+            self.assertEqual(kl_basis[x.index], kl_basis[x.name])
+        self.assertEqual(list(kl_basis.keys()),
+                         [x.name for x in group.all_elements()])
+
+        # Words in the generators are accepted everywhere, unknown names are not
+        self.assertEqual(hecke.element({'srs': l.one}), hecke.element({'rsr': l.one}))
+        self.assertEqual(kl_basis['srs'], kl_basis['rsr'])
+        self.assertIn('srs', kl_basis)
+        self.assertNotIn('x', kl_basis)
+        self.assertNotIn(100, kl_basis)
+        self.assertIs(kl_basis.get('rs'), kl_basis['rs'])
+        self.assertIsNone(kl_basis.get('x'))
+        self.assertEqual(kl_basis.get('x', hecke.zero), hecke.zero)
+        with self.assertRaises(KeyError):
+            hecke.element({'x': l.one})
+        self.assertEqual(hecke.left_cells().label('srs'),
+                         hecke.left_cells().label('rsr'))
+
+    def test_accumulator(self):
+        group = c.generate_a2()
+        hecke = h.HeckeAlgebra(group)
+
+        h1 = hecke.element({
+            'e': l.Laurent({-1: 10, 2: 3}),
+            's': l.Laurent({0: 1, 1: 3})
+        })
+        h2 = hecke.element({
+            's': l.Laurent({0: -1, 1: -3}),
+            'rsr': l.Laurent({20: -12})
+        })
+        p = l.Laurent({-1: 1, 1: 2})
+
+        acc = h.HeckeAccumulator(hecke, h1)
+        acc.add_scaled(h2, p)
+        acc.add_term(group['r'].index, p)
+        self.assertEqual(acc.element(),
+                         h1 + h2 * p + hecke.element({'r': p}))
+
+        acc = h.HeckeAccumulator(hecke, h1)
+        acc.add_scaled(h1, l.Laurent({0: -1}))
+        self.assertTrue(acc.is_zero())
+        self.assertEqual(acc.element().terms, {})
+
+    def test_actions(self):
+        group = c.generate_a3()
+        hecke = h.HeckeAlgebra(group)
+        for x in group.all_elements():
+            h_x = hecke.get_standard_basis_element(x.name)
+            for s in range(len(group.generator_names)):
+                h_s = hecke.get_standard_basis_element(group.generator_names[s])
+                self.assertEqual(hecke.right_action(h_x, s), h_x * h_s)
+                # H_s H_x = (H_x^-1 H_s)^i
+                self.assertEqual(hecke.left_action(s, h_x),
+                                 hecke.right_action(h_x.i(), s).i())
+
+        a = hecke.element({
+            'e': l.Laurent({-1: 10, 2: 3}),
+            's': l.Laurent({0: 1, 1: 3}),
+            'rst': l.Laurent({1: 2})
+        })
+        b = hecke.element({
+            'srts': l.Laurent({0: -1, 1: -3}),
+            'rsr': l.Laurent({2: -12}),
+            't': l.one
+        })
+        expected = h.HeckeAccumulator(hecke)
+        for x, p in a.terms.items():
+            for y, q in b.terms.items():
+                # H_x H_y as H_x H_s1 ... H_sk
+                h_xy = hecke.get_standard_basis_element(x)
+                for s in group.word(y):
+                    h_xy = hecke.right_action(h_xy, s)
+                expected.add_scaled(h_xy, p * q)
+        expected = expected.element()
+        # Both sides of the product are chosen depending on the supports
+        self.assertEqual(hecke.multiply(a, b), expected)
+        self.assertEqual(hecke.multiply(b.i(), a.i()), expected.i())
+
+    def test_product_cache(self):
+        group = c.generate_b3()
+        cached = h.HeckeAlgebra(group)
+        uncached = h.HeckeAlgebra(group, cache_size=0)
+        for x in group.all_elements():
+            for y in ['e', 'r', 'st', 'rts', x.name]:
+                self.assertEqual(cached.simple_mul(x.name, y),
+                                 uncached.simple_mul(x.name, y))
+        info = cached.cache_info()
+        self.assertGreater(info.hits, 0)
+        self.assertLessEqual(info.terms, info.max_terms)
+        self.assertEqual(uncached.cache_info().products, 0)
+
+        # Least recently used products are evicted first
+        cache = h.ProductCache(3)
+        cache.put((1, 1), {0: l.one})
+        cache.put((1, 2), {0: l.one, 1: l.one})
+        self.assertIsNotNone(cache.get((1, 1)))
+        cache.put((2, 2), {2: l.one})
+        self.assertIsNone(cache.get((1, 2)))
+        self.assertIsNotNone(cache.get((1, 1)))
+        self.assertEqual(cache.info(), (2, 1, 2, 2, 3))
+
+    def test_dense(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        a = kl_basis['rst'] + hecke.element({'e': l.Laurent({-2: 3}), 's': l.v})
+        b = kl_basis['srts'] * l.Laurent({-1: 2, 3: -1})
+        dense_a = a.to_dense()
+        dense_b = b.to_dense()
+        self.assertIsInstance(dense_a, h.DenseHeckeElement)
+        self.assertEqual(dense_a.to_dict(), a)
+        self.assertEqual(dense_a + dense_b, a + b)
+        self.assertEqual(dense_a - dense_a, hecke.zero)
+        self.assertEqual((dense_a - dense_b).to_dict().terms, (a - b).terms)
+        self.assertEqual(dense_a * 3, a * 3)
+        self.assertEqual(dense_a * l.v_plus_v_inverse, a * l.v_plus_v_inverse)
+        self.assertEqual(dense_a.shift(-2), a.shift(-2))
+        self.assertEqual(dense_a.involute(), a.involute())
+        self.assertEqual(dense_a.i(), a.i())
+        self.assertEqual(dense_a['srt'], a['srt'])
+        # Products on both sides, and with dict-backed elements
+        self.assertEqual(dense_a * dense_b, a * b)
+        self.assertEqual(dense_b * dense_a, b * a)
+        self.assertEqual(a * dense_b, a * b)
+        self.assertEqual(hecke.zero.to_dense() * dense_a, hecke.zero)
+
+        dense = h.HeckeAlgebra(group, backend='dense')
+        h_s = dense.get_standard_basis_element('s')
+        self.assertIsInstance(h_s, h.DenseHeckeElement)
+        self.assertEqual((h_s * h_s).to_dict().elements,
+                         {'e': l.one, 's': l.v_inverse_minus_v})
+        self.assertEqual(dense.element({'rs': l.one}).in_kl_basis(),
+                         {'rs': l.one, 'r': l.Laurent({1: -1}),
+                          's': l.Laurent({1: -1}), 'e': l.Laurent({2: 1})})
+
+    def test_triangular_decomposition(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        dual_kl_basis = hecke.generate_dual_kl_basis()
+        n = len(group.names)
+        self.assertEqual(kl_basis.order(), list(range(n - 1, -1, -1)))
+        self.assertEqual(dual_kl_basis.order(), list(range(n)))
+
+        elements = [hecke.get_standard_basis_element(x) * l.Laurent({-1: 2, 2: 1}) +
+                    dual_kl_basis[x] for x in range(0, n, 5)]
+        for basis in [kl_basis, dual_kl_basis]:
+            decompositions = hecke.in_basis_many(elements, basis)
+            for element, decomposition in zip(elements, decompositions):
+                self.assertEqual(element.in_basis(basis), decomposition)
+                ret = hecke.zero
+                for name, coeff in decomposition.items():
+                    ret += basis[name] * coeff
+                self.assertEqual(ret, element)
+            # The same as the decomposition by lowest degree terms
+            self.assertEqual(h._decompose_by_degree(elements[1], basis),
+                             basis.decompose(elements[1]))
+
+        # A basis given by a dictionary, in no index order
+        basis = {
+            'e': hecke.element({'e': l.one}),
+            'r': hecke.element({'r': l.one, 's': l.v}),
+            's': hecke.element({'s': l.one, 'e': l.v}),
+        }
+        element = hecke.element({'r': l.one, 'e': l.v_inverse})
+        self.assertEqual(element.in_basis(basis),
+                         {'r': l.one, 's': l.Laurent({1: -1}),
+                          'e': l.Laurent({-1: 1, 2: 1})})
+
+        # No order if a basis element has no H_x term
+        basis = h.Basis.from_dict(hecke, {
+            'e': hecke.element({'e': l.one}),
+            'r': hecke.element({'s': l.one}),
+        })
+        self.assertIsNone(basis.order())
+
+    def test_inverse_matrices(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        for basis in [hecke.generate_kl_basis(), hecke.generate_dual_kl_basis()]:
+            # The closed formulas agree with inverting the basis matrix
+            inverted = m.PolynomialMatrix.from_basis(basis).inverse_unitriangular(
+                basis.order())
+            self.assertEqual(basis.inverse_matrix(), inverted)
+            for x in group.all_elements():
+                self.assertEqual(
+                    basis.decompose(hecke.get_standard_basis_element(x.index)),
+                    inverted.columns[x.index])
+
+        uncached = h.HeckeAlgebra(group, inverse_matrices=False)
+        dual_kl_basis = hecke.generate_dual_kl_basis()
+        for x in ['e', 'rs', 'srt', 'tsrt']:
+            element = dual_kl_basis[x] * hecke.generate_kl_basis()['s']
+            self.assertEqual(element.in_kl_basis(),
+                             uncached.element(element.elements).in_kl_basis())
+            self.assertEqual(element.in_dual_kl_basis(),
+                             uncached.element(element.elements).in_dual_kl_basis())
+
+    def test_dual_kl_basis_methods(self):
+        for group in [c.generate_a3(), c.generate_b3()]:
+            inversion = h.HeckeAlgebra(group).generate_dual_kl_basis()
+            recursion = h.HeckeAlgebra(group).generate_dual_kl_basis(method='recursion')
+            for x in group.all_elements():
+                self.assertEqual(inversion[x.index], recursion[x.index])
+
+    def test_standard_dual_matrix(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        duals = hecke.standard_dual_matrix()
+        for x in group.all_elements():
+            # The dual of H_x is the product of the H_s^-1 along a reduced word
+            product = hecke.one
+            for generator in hecke.word(x.index):
+                product *= hecke.get_generator_inverse_element(generator)
+            self.assertEqual(hecke.get_standard_dual(x.name), product)
+            self.assertEqual(duals[x.index, x.index], l.one)
+            self.assertEqual(
+                hecke.get_standard_basis_element(x.name) *
+                hecke.get_standard_inverse_element(x.name), hecke.one)
+
+        # The dual is an involution and fixes the KL basis
+        kl_basis = hecke.generate_kl_basis()
+        for x in group.all_elements():
+            self.assertEqual(kl_basis[x.index].dual(), kl_basis[x.index])
+            self.assertEqual(kl_basis[x.index].dual().dual(), kl_basis[x.index])
+            element = hecke.element({x.name: l.Laurent({-1: 2, 3: 1})})
+            self.assertEqual(element.dual().dual(), element)
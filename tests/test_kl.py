@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+import jk.hecke.laurent as l
+from jk.hecke import coxeter as c, hecke as h, kl, matrix as m
+
+
+class TestKL(unittest.TestCase):
+    def test_singular_a3(self):
+        group = c.generate_a3()
+        polynomials = kl.KLPolynomials(group)
+
+        # P_{e,3412} = P_{s2,3412} = 1 + q
+        srts = group['srts'].index
+        self.assertEqual(polynomials.h(group['e'].index, srts),
+                         l.Laurent({2: 1, 4: 1}))
+        self.assertEqual(polynomials.h(group['s'].index, srts),
+                         l.Laurent({1: 1, 3: 1}))
+        self.assertEqual(polynomials.mu(group['s'].index, srts), 1)
+        self.assertEqual(polynomials.h(group['rst'].index, srts), l.zero)
+
+        # P_{e,4231} = 1 + q
+        self.assertEqual(polynomials.h(group['e'].index, group['rstsr'].index),
+                         l.Laurent({3: 1, 5: 1}))
+
+    def test_recursion(self):
+        """C_x C_s = C_xs + sum_{y < x, ys < y} mu(y, x) C_y"""
+        group = c.generate_a3()
+        hecke = h.HeckeAlgebra(group)
+        polynomials = hecke.kl_polynomials()
+        kl_basis = hecke.generate_kl_basis()
+
+        for w in group.all_elements()[1:]:
+            x = int(group.prefix[w.index])
+            s = int(group.last_generator[w.index])
+            expected = kl_basis[x] * kl_basis[int(group.right_mul[0, s])]
+            for y in polynomials[x]:
+                if y != x and group.is_right_descent(y, s):
+                    expected -= kl_basis[y] * polynomials.mu(y, x)
+            self.assertEqual(kl_basis[w.index], expected)
+            self.assertEqual(kl_basis[w.index], kl_basis[w.index].dual())
+
+    def test_kl_basis_view(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        polynomials = hecke.kl_polynomials()
+        kl_basis = hecke.generate_kl_basis()
+        # The basis elements wrap the columns of the table
+        for w in group.all_elements():
+            self.assertIs(kl_basis[w.index].terms, polynomials[w.index])
+        self.assertEqual(kl_basis.order(), list(range(len(group.names) - 1, -1, -1)))
+
+    def test_modular(self):
+        for group in [c.generate_a4(), c.generate_b3(), c.generate_d4()]:
+            exact = kl.KLPolynomials(group)
+            modular = kl.KLPolynomials(group, primes=kl.PRIMES)
+            self.assertEqual(exact.table, modular.table)
+
+        group = c.generate_a3()
+        self.assertEqual(
+            h.HeckeAlgebra(group, arithmetic='modular').generate_kl_basis()['srts'],
+            h.HeckeAlgebra(group).generate_kl_basis()['srts'])
+
+    def test_parallel(self):
+        group = c.generate_d4()
+        serial = kl.KLPolynomials(group)
+        parallel = kl.KLPolynomials(group, workers=2)
+        self.assertEqual(serial.table, parallel.table)
+        for h_serial, h_parallel in zip(serial.table, parallel.table):
+            self.assertEqual(list(h_serial), list(h_parallel))
+
+        group = c.generate_b3()
+        self.assertEqual(
+            h.HeckeAlgebra(group, workers=2).generate_kl_basis()['rsts'],
+            h.HeckeAlgebra(group).generate_kl_basis()['rsts'])
+
+    def test_shared_table(self):
+        group = c.generate_b3()
+        table = kl.KLPolynomials(group).table
+        lengths = group.lengths
+        with tempfile.TemporaryDirectory() as directory:
+            for length in range(int(lengths.max()) + 1):
+                layer = np.flatnonzero(lengths == length).tolist()
+                m.save_columns(directory, f'layer{length}',
+                               [table[w] for w in layer])
+            shared = kl._SharedTable(directory, lengths.tolist(), capacity=20)
+            for y in list(range(len(table))) * 2:
+                self.assertEqual(shared[y], table[y])
+                self.assertEqual(shared.entries,
+                                 sum(map(len, shared.columns.values())))
+                self.assertTrue(shared.entries <= 20 or len(shared.columns) == 1)
+
+    def test_crt(self):
+        p, q = kl.PRIMES[0], kl.PRIMES[1]
+        values = np.array([[3, 0, 5 * 10 ** 12], [-7 * 10 ** 15, 1, -1]])
+        lifted = kl._crt(values % p, p, values % q, q)
+        np.testing.assert_array_equal(kl._symmetric(lifted, p * q), values)
@@ -152,3 +152,74 @@ class TestLaurent(unittest.TestCase):
         p = l.Laurent({-1: 1, 0: 1})
 
         self.assertEqual(p(1), 2)
+
+    def test_from_coefficients(self):
+        p = l.Laurent.from_coefficients(-2, [0, 1, 0, 3, 0])
+        self.assertEqual(p, l.Laurent({-1: 1, 1: 3}))
+        self.assertEqual(p.offset, -1)
+        self.assertEqual(p.coefficients, (1, 0, 3))
+        self.assertEqual(l.Laurent.from_coefficients(5, [0, 0]), l.zero)
+
+    def test_cancellation(self):
+        p = l.Laurent({-1: 1, 0: 2, 3: 1})
+        q = l.Laurent({-1: -1, 3: -1})
+        self.assertEqual(p + q, l.Laurent({0: 2}))
+        self.assertEqual((p + q).bottom(), 0)
+        self.assertEqual((p + q).top(), 0)
+        self.assertEqual(p - p, l.zero)
+        self.assertEqual(p.items(), [(-1, 1), (0, 2), (3, 1)])
+
+    def test_immutable(self):
+        p = l.Laurent({0: 1, 2: 3})
+        with self.assertRaises(AttributeError):
+            p.offset = 1
+        with self.assertRaises(AttributeError):
+            p.foo = 1
+        self.assertEqual(p, l.Laurent({0: 1, 2: 3}))
+
+    def test_hash(self):
+        p = l.Laurent({-1: 5, 2: 3, 4: 1})
+        q = l.Laurent({-1: 5, 2: 3}) + l.Laurent({4: 1})
+        self.assertEqual(hash(p), hash(q))
+        self.assertEqual({p: 1}[q], 1)
+        # Other objects compare unequal, also as dict keys
+        self.assertNotEqual(l.one, None)
+        self.assertFalse(l.one == 'one')
+        self.assertNotIn(p, {None: 1, 'p': 2})
+
+    def test_intern(self):
+        self.assertIs(l.Laurent({1: 1}), l.v)
+        self.assertIs(l.Laurent({0: 2}) - l.Laurent({0: 1}), l.one)
+        self.assertIs(l.Laurent({-1: 1, 1: 1}), l.v_plus_v_inverse)
+        self.assertIs(l.one.shift(3), l.Laurent({3: 1}))
+
+        p = l.Laurent({0: 100, 1: 200, 5: 300})
+        self.assertIsNot(p, l.Laurent({0: 100, 1: 200, 5: 300}))
+        self.assertIs(l.intern(p), p)
+        self.assertIs(l.Laurent({0: 100, 1: 200, 5: 300}), p)
+
+    def test_accumulator(self):
+        a = l.Laurent({-1: 1, 0: 2, 1: 3})
+        b = l.Laurent({0: 2, 1: 4, 2: -1})
+        c = l.Laurent({-5: 1, 4: 7})
+
+        acc = l.LaurentAccumulator(c)
+        acc.iadd_mul(a, b)
+        acc.iadd(a)
+        acc.iadd_mul(b, l.zero)
+        self.assertEqual(acc.laurent(), c + a * b + a)
+        self.assertEqual(acc.bottom(), -5)
+
+        acc = l.LaurentAccumulator()
+        acc.iadd(a)
+        acc.iadd(-a)
+        self.assertEqual(acc.bottom(), None)
+        self.assertEqual(acc.laurent(), l.zero)
+
+    def test_pack(self):
+        polynomials = [l.Laurent({-1: 2, 3: 1}), l.zero, l.v, l.Laurent({5: -7})]
+        offsets, pointers, coefficients = l.pack(polynomials)
+        self.assertEqual(pointers.tolist(), [0, 5, 5, 6, 7])
+        packed = (offsets.tolist(), pointers.tolist(), coefficients.tolist())
+        for i, p in enumerate(polynomials):
+            self.assertEqual(l.unpack(*packed, i), p)
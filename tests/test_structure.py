@@ -0,0 +1,60 @@
+import io
+import unittest
+
+import jk.hecke.laurent as l
+from jk.hecke import coxeter as c, hecke as h
+
+
+class TestStructure(unittest.TestCase):
+    def test_structure_constants(self):
+        group = c.generate_a3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        constants = hecke.kl_structure_constants()
+        self.assertIs(hecke.kl_structure_constants(), constants)
+        for x in group.all_elements():
+            for y in group.all_elements():
+                self.assertEqual(constants[x.index, y.index],
+                                 (kl_basis[x.index] * kl_basis[y.index])._in_basis(kl_basis))
+        rs = group['rs'].index
+        srt = group['srt'].index
+        self.assertEqual(constants.h(rs, srt, group['rsrt'].index), l.v_plus_v_inverse)
+        self.assertEqual(constants.h(rs, srt, rs), l.zero)
+
+    def test_generators(self):
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        constants = hecke.kl_structure_constants(group.generator_names)
+        self.assertEqual(constants.xs, [1, 2, 3])
+        for s in group.generator_names:
+            for y in group.all_elements():
+                self.assertEqual(constants[group[s].index, y.index],
+                                 (kl_basis[s] * kl_basis[y.index])._in_basis(kl_basis))
+        with self.assertRaises(KeyError):
+            constants[group['rs'].index, 0]
+
+    def test_multiply_and_load(self):
+        group = c.generate_a3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        constants = hecke.kl_structure_constants(['r', 'rs', 'srt'])
+        a = {group['r'].index: l.v, group['srt'].index: l.Laurent({-1: 2, 0: 1})}
+        b = {group['st'].index: l.one, group['rst'].index: l.v_minus_v_inverse}
+        element_a = hecke.zero
+        for x, p in a.items():
+            element_a += kl_basis[x] * p
+        element_b = hecke.zero
+        for y, p in b.items():
+            element_b += kl_basis[y] * p
+        self.assertEqual(constants.multiply(a, b),
+                         (element_a * element_b)._in_basis(kl_basis))
+
+        file = io.BytesIO()
+        constants.save(file)
+        file.seek(0)
+        loaded = h.st.KLStructureConstants.load(file)
+        self.assertEqual(loaded.xs, constants.xs)
+        for x in constants.xs:
+            for y in range(len(group.names)):
+                self.assertEqual(loaded[x, y], constants[x, y])
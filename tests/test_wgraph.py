@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from jk.hecke import coxeter as c, hecke as h
+
+
+class TestWGraph(unittest.TestCase):
+    def test_products(self):
+        # C_x C_s = sum_{y : s in R(y)} mu~(x,y) C_y if s is not in R(x)
+        group = c.generate_b3()
+        hecke = h.HeckeAlgebra(group)
+        kl_basis = hecke.generate_kl_basis()
+        w_graph = hecke.w_graph()
+        for x in group.all_elements():
+            for position, s in enumerate(group.generator_names):
+                if group.is_right_descent(x.index, position):
+                    continue
+                expected = {y: w_graph.mu(x.index, y)
+                            for y, _ in w_graph.neighbours(x.index)
+                            if group.is_right_descent(y, position)}
+                product = (kl_basis[x.index] * kl_basis[s])._in_basis(kl_basis)
+                self.assertEqual({y: p[0] for y, p in product.items()}, expected)
+
+    def test_digraph(self):
+        for group in [c.generate_a3(), c.generate_b3()]:
+            hecke = h.HeckeAlgebra(group)
+            kl_basis = hecke.generate_kl_basis()
+            digraph = hecke._generate_digraph()
+            for x in group.all_elements():
+                expected = set()
+                for s in group.generator_names:
+                    expected.update(
+                        (kl_basis[x.index] * kl_basis[s])._in_basis(kl_basis).keys())
+                self.assertEqual(digraph[x.index], expected)
+
+    def test_symmetric(self):
+        group = c.generate_a3()
+        w_graph = h.HeckeAlgebra(group).w_graph()
+        for x in group.all_elements():
+            for y, mu in w_graph.neighbours(x.index):
+                self.assertEqual(w_graph.mu(y, x.index), mu)
+                self.assertNotEqual(mu, 0)
+        self.assertEqual(w_graph.mu(group['r'].index, group['rs'].index), 1)
+        self.assertEqual(w_graph.mu(group['r'].index, group['t'].index), 0)
+
+    def test_parallel(self):
+        group = c.generate_b3()
+        kl_polynomials = h.HeckeAlgebra(group).kl_polynomials()
+        serial = h.wg.WGraph(group, kl_polynomials)
+        parallel = h.wg.WGraph(group, kl_polynomials, workers=3)
+        for name in ['offsets', 'targets', 'weights']:
+            np.testing.assert_array_equal(getattr(serial, name),
+                                          getattr(parallel, name))
+        self.assertEqual(serial.right_digraph(), parallel.right_digraph())